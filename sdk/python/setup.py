@@ -31,7 +31,7 @@ setup(
     python_requires=">=3.8",
     install_requires=[
         "fastapi>=0.68.0,<1.0.0",
-        "uvicorn>=0.15.0,<1.0.0",
+        "uvicorn>=0.18.0,<1.0.0",
         "pydantic>=1.8.0,<2.0.0",
         "python-multipart>=0.0.5,<1.0.0",
         "python-jose[cryptography]>=3.3.0,<4.0.0",
@@ -41,12 +41,15 @@ setup(
         "alembic>=1.7.0,<2.0.0",
         "python-dateutil>=2.8.2,<3.0.0",
         "toml>=0.10.0,<1.0.0",
-        "uvicorn[standard]>=0.15.0,<1.0.0",
+        "uvicorn[standard]>=0.18.0,<1.0.0",
         "requests>=2.26.0,<3.0.0",
         "websocket-client>=1.5.0,<2.0.0",
         "httpx>=0.23.0,<1.0.0",
     ],
     extras_require={
+        "speedups": [
+            "orjson>=3.6.0,<4.0.0",
+        ],
         "dev": [
             "pytest>=6.0",
             "pytest-cov>=2.0",
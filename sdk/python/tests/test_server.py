@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+from ticos_client.server import UnifiedServer
+from ticos_client.ticos_client_interface import MessageCallbackInterface
+
+
+class _Callback(MessageCallbackInterface):
+    def handle_message(self, message):
+        return True
+
+
+class _FakeWebSocket:
+    """Stands in for a connected client; send_text fails when fail is set."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.sent = []
+
+    async def send_text(self, text: str):
+        await asyncio.sleep(0)
+        if self.fail:
+            raise ConnectionError("client went away")
+        self.sent.append(text)
+
+
+class TestUnifiedServer(unittest.TestCase):
+    def setUp(self):
+        self.server = UnifiedServer(_Callback(), port=0)
+
+    def _run(self, coro, timeout: float = 5.0):
+        """
+        Run a coroutine on its own loop in a worker thread, so a deadlock fails
+        the test instead of hanging the suite.
+        """
+        result = {}
+
+        def target():
+            result["value"] = asyncio.run(coro)
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        self.assertFalse(thread.is_alive(), "coroutine did not finish, event loop is blocked")
+        return result["value"]
+
+    def test_broadcast_drops_failed_connections(self):
+        """A failed send unregisters that client without blocking the loop."""
+        good, bad = _FakeWebSocket(), _FakeWebSocket(fail=True)
+        self.server.websocket_connections.extend([bad, good])
+
+        self.assertTrue(self._run(self.server.broadcast_message({"type": "ping"})))
+
+        self.assertEqual(good.sent, ['{"type":"ping"}'])
+        self.assertEqual(self.server.websocket_connections, [good])
+
+    def test_broadcast_does_not_hold_lock_while_sending(self):
+        """Clients can (un)register on the loop while a send is waiting."""
+        server = self.server
+        leaving = _FakeWebSocket()
+
+        class SlowWebSocket(_FakeWebSocket):
+            async def send_text(self, text: str):
+                # Another client disconnects while this send is in progress
+                await server._unregister_websocket(leaving)
+                await super().send_text(text)
+
+        slow = SlowWebSocket()
+        server.websocket_connections.extend([slow, leaving])
+
+        self.assertTrue(self._run(server.broadcast_message("text")))
+        self.assertEqual(server.websocket_connections, [slow])
+
+    def test_broadcast_queue_ready_before_loop_published(self):
+        """Once enqueue_broadcast() can see the loop, the queue it feeds already exists."""
+        seen = []
+
+        class WatchedServer(UnifiedServer):
+            def __setattr__(self, name, value):
+                if name == "loop" and value is not None:
+                    seen.append(self._broadcast_queue is not None)
+                super().__setattr__(name, value)
+
+        server = WatchedServer(_Callback(), port=0)
+        uvicorn_server = mock.Mock()
+        uvicorn_server.return_value.serve = mock.AsyncMock()
+        with mock.patch("ticos_client.server._ReadyNotifyingServer", uvicorn_server):
+            self._run(server._serve_uvicorn())
+
+        self.assertEqual(seen, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
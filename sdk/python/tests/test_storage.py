@@ -0,0 +1,414 @@
+import gc
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from ticos_client import Durability, Message, MessageRole, Memory, MemoryType
+from ticos_client.storage import SQLiteStorageService
+
+
+class TestSQLiteStorageService(unittest.TestCase):
+    def setUp(self):
+        # Use a throwaway directory so each test gets a fresh database
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.storage = SQLiteStorageService()
+        self.storage.set_store_root_dir(self.temp_dir.name)
+        self.storage.initialize()
+
+    def tearDown(self):
+        self.storage.close()
+        self.temp_dir.cleanup()
+
+    def _make_message(self, index: int, role: MessageRole = MessageRole.USER) -> Message:
+        return Message(
+            id=str(1000 + index),
+            role=role,
+            content=f"message {index}",
+            item_id=f"item-{index}",
+            datetime=f"2024-01-01 00:00:{index:02d}",
+        )
+
+    def test_save_messages_batch(self):
+        """Batch inserts are chunked but all rows land in storage."""
+        messages = [self._make_message(i) for i in range(25)]
+        self.assertTrue(self.storage.save_messages(messages, chunk_size=10))
+
+        stored = self.storage.get_messages(0, 100, desc=False)
+        self.assertEqual([m.id for m in stored], [m.id for m in messages])
+        self.assertEqual(stored[0].role, MessageRole.USER)
+
+    def test_save_messages_multi_row_batches(self):
+        """Rows spanning several multi-row inserts keep their order, later duplicates win."""
+        messages = [self._make_message(i % 60) for i in range(250)]
+        messages[-1].content = "last"
+        self.assertTrue(self.storage.save_messages(messages))
+
+        stored = self.storage.get_messages(0, 100, desc=False)
+        self.assertEqual([m.id for m in stored], [m.id for m in messages[:60]])
+        self.assertEqual(self.storage.get_message(messages[-1].id).content, "last")
+
+    def test_save_message_replaces_existing(self):
+        """Saving a message with an existing id overwrites it."""
+        message = self._make_message(1)
+        self.assertTrue(self.storage.save_message(message))
+
+        message.content = "edited"
+        self.assertTrue(self.storage.save_message(message))
+
+        stored = self.storage.get_message(message.id)
+        self.assertEqual(stored.content, "edited")
+        self.assertEqual(len(self.storage.get_messages(0, 100)), 1)
+
+    def test_update_message_removes_incremental_previous(self):
+        """Updating a user message that extends the previous user message deletes the earlier one."""
+        previous = self._make_message(1)
+        previous.content = "hello"
+        current = self._make_message(2)
+        current.content = "hello there"
+        self.storage.save_messages([previous, current])
+
+        current.content = "hello there, world."
+        self.assertTrue(self.storage.update_message(current.id, current))
+        self.assertIsNone(self.storage.get_message(previous.id))
+        self.assertEqual(self.storage.get_message(current.id).content, "hello there, world.")
+
+    def test_update_message_keeps_unrelated_previous(self):
+        """Previous messages that are not a prefix, or not from the user, are kept."""
+        assistant = self._make_message(1, MessageRole.ASSISTANT)
+        unrelated = self._make_message(2)
+        unrelated.content = "goodbye"
+        current = self._make_message(3)
+        self.storage.save_messages([assistant, unrelated, current])
+
+        current.content = "message 3 again"
+        self.assertTrue(self.storage.update_message(current.id, current))
+        self.assertEqual(len(self.storage.get_messages(0, 10)), 3)
+
+        # Identical after dropping trailing punctuation is not an incremental update
+        current.content = "goodbye."
+        self.assertTrue(self.storage.update_message(current.id, current))
+        self.assertEqual(len(self.storage.get_messages(0, 10)), 3)
+
+    def test_update_message_content_by_item_id(self):
+        """The content is replaced by item_id, dropping an earlier user message it extends."""
+        previous = self._make_message(1)
+        previous.content = "hello"
+        self.storage.save_message(previous)
+        current = self._make_message(2)
+        current.content = ""
+        self.storage.save_message(current)
+
+        self.assertTrue(self.storage.update_message_content_by_item_id(current.item_id, "hello there"))
+        self.assertIsNone(self.storage.get_message(previous.id))
+        stored = self.storage.get_message(current.id)
+        self.assertEqual((stored.content, stored.datetime), ("hello there", current.datetime))
+
+        self.assertFalse(self.storage.update_message_content_by_item_id("missing", "text"))
+        self.assertEqual(len(self.storage.get_messages(0, 10)), 1)
+
+    def test_update_message_content_by_item_id_updates_one_row(self):
+        """Only the newest message sharing an item_id is updated."""
+        older, newer = self._make_message(1), self._make_message(2)
+        older.content, newer.content = "first", "second"
+        older.item_id = newer.item_id = "shared"
+        self.storage.save_messages([older, newer])
+
+        self.assertTrue(self.storage.update_message_content_by_item_id("shared", "updated"))
+        self.assertEqual(self.storage.get_message(older.id).content, "first")
+        self.assertEqual(self.storage.get_message(newer.id).content, "updated")
+
+    def test_get_max_message_id(self):
+        """The highest numeric ID wins regardless of datetime or text order; others are ignored."""
+        self.assertIsNone(self.storage.get_max_message_id())
+
+        for message_id, second in (("999", 3), ("1000", 1), ("test-id", 2), ("", 4)):
+            message = self._make_message(second)
+            message.id = message_id
+            self.storage.save_message(message)
+
+        self.assertEqual(self.storage.get_max_message_id(), 1000)
+
+    def test_get_messages_without_content(self):
+        """Metadata-only pages keep ids and order but leave content empty."""
+        messages = [self._make_message(i) for i in range(3)]
+        self.storage.save_messages(messages)
+
+        stored = self.storage.get_messages(0, 10, with_content=False)
+        self.assertEqual([m.id for m in stored], [m.id for m in reversed(messages)])
+        self.assertEqual({m.content for m in stored}, {""})
+
+    def test_get_messages_filters(self):
+        """Role and since filters are applied in SQL, alone or combined."""
+        messages = [
+            self._make_message(i, MessageRole.USER if i % 2 else MessageRole.ASSISTANT)
+            for i in range(6)
+        ]
+        self.storage.save_messages(messages)
+
+        users = self.storage.get_messages(0, 10, desc=False, role=MessageRole.USER)
+        self.assertEqual([m.id for m in users], ["1001", "1003", "1005"])
+
+        recent = self.storage.get_messages(0, 10, desc=False, since="2024-01-01 00:00:03")
+        self.assertEqual([m.id for m in recent], ["1003", "1004", "1005"])
+
+        both = self.storage.get_messages(0, 10, role=MessageRole.ASSISTANT, since="2024-01-01 00:00:03")
+        self.assertEqual([m.id for m in both], ["1004"])
+
+    def test_iter_messages_pages(self):
+        """Iterating pages through the whole table in order, honouring limit."""
+        messages = [self._make_message(i) for i in range(12)]
+        self.storage.save_messages(messages)
+
+        streamed = list(self.storage.iter_messages(desc=False, page_size=5))
+        self.assertEqual([m.id for m in streamed], [m.id for m in messages])
+
+        limited = list(self.storage.iter_messages(offset=2, limit=7, desc=False, page_size=5))
+        self.assertEqual([m.id for m in limited], [m.id for m in messages[2:9]])
+
+    def test_reinitialize_after_close(self):
+        """A closed service can be initialized again and keeps its data."""
+        self.storage.save_message(self._make_message(1))
+        db_path = self.storage.db_path
+        self.storage.close()
+
+        self.storage.initialize()
+        self.assertEqual(self.storage.db_path, db_path)
+        self.assertEqual(self.storage.get_message("1001").content, "message 1")
+
+    def test_get_messages_after(self):
+        """Keyset pages continue after the token, including rows sharing a timestamp."""
+        messages = [
+            Message(id=str(1000 + i), role=MessageRole.USER, content=str(i), datetime="2024-01-01 00:00:00")
+            for i in range(5)
+        ]
+        self.storage.save_messages(messages)
+
+        first = self.storage.get_messages_after(None, 2, desc=False)
+        self.assertEqual([m.id for m in first], ["1000", "1001"])
+        rest = self.storage.get_messages_after((first[-1].datetime, first[-1].id), 10, desc=False)
+        self.assertEqual([m.id for m in rest], ["1002", "1003", "1004"])
+
+    def test_save_memory_assigns_id(self):
+        """save_memory fills in the id of the inserted row."""
+        memory = Memory(type=MemoryType.LONG_TERM, content="remember", datetime="2024-01-01 00:00:00")
+        self.assertTrue(self.storage.save_memory(memory))
+
+        self.assertIsNotNone(memory.id)
+        self.assertEqual(self.storage.get_memory(memory.id)["content"], "remember")
+
+    def test_save_memory_ids_without_returning(self):
+        """Ids come from the plain INSERT, so SQLite before 3.35 (no RETURNING) works."""
+        statements = []
+        original = self.storage._get_connection
+
+        def traced():
+            conn = original()
+            conn.set_trace_callback(statements.append)
+            return conn
+
+        with mock.patch.object(self.storage, "_get_connection", traced):
+            first = Memory(type=MemoryType.LONG_TERM, content="first", datetime="2024-01-01 00:00:00")
+            second = Memory(type=MemoryType.LONG_TERM, content="second", datetime="2024-01-01 00:00:01")
+            self.assertTrue(self.storage.save_memory(first))
+            self.assertTrue(self.storage.save_memory(second))
+
+        inserts = [s for s in statements if s.startswith("INSERT INTO memories")]
+        self.assertEqual(len(inserts), 2)
+        self.assertFalse([s for s in inserts if "RETURNING" in s.upper()])
+        self.assertEqual(second.id, first.id + 1)
+        self.assertEqual(self.storage.get_latest_memory()["id"], second.id)
+
+    def test_save_memories_batch(self):
+        """Batch memory inserts are returned newest first."""
+        memories = [
+            Memory(
+                type=MemoryType.LONG_TERM,
+                content=f"memory {i}",
+                datetime=f"2024-01-01 00:00:{i:02d}",
+            )
+            for i in range(3)
+        ]
+        self.assertTrue(self.storage.save_memories(memories))
+
+        self.assertEqual(self.storage.get_latest_memory()["content"], "memory 2")
+        self.assertEqual(len(self.storage.get_memories(0, 10)), 3)
+
+    def test_iter_memories(self):
+        """Streamed memories honour offset, limit and order across fetch batches."""
+        memories = [
+            Memory(type=MemoryType.LONG_TERM, content=f"memory {i}", datetime=f"2024-01-01 00:00:{i:02d}")
+            for i in range(10)
+        ]
+        self.storage.save_memories(memories)
+
+        streamed = list(self.storage.iter_memories(desc=False, page_size=3))
+        self.assertEqual([m["content"] for m in streamed], [m.content for m in memories])
+
+        limited = list(self.storage.iter_memories(offset=2, limit=5, page_size=3))
+        self.assertEqual([m["content"] for m in limited], [f"memory {i}" for i in range(7, 2, -1)])
+
+    def test_get_context_bundle(self):
+        """The bundle matches separate get_messages and get_latest_memory calls."""
+        self.assertEqual(self.storage.get_context_bundle(5), ([], None))
+
+        self.storage.save_messages([self._make_message(i) for i in range(8)])
+        self.storage.save_memory(Memory(type=MemoryType.LONG_TERM, content="latest", datetime="2024-01-01 00:01:00"))
+
+        messages, latest_memory = self.storage.get_context_bundle(5)
+        self.assertEqual([m.id for m in messages], [m.id for m in self.storage.get_messages(0, 5, True)])
+        self.assertEqual(latest_memory, self.storage.get_latest_memory())
+        self.assertFalse(self.storage._get_read_connection().in_transaction)
+
+    def test_reads_use_read_only_connection_per_thread(self):
+        """Reads go through a read-only connection of their own thread and see committed writes."""
+        self.storage.save_message(self._make_message(1))
+        reader = self.storage._get_read_connection()
+        self.assertIsNot(reader, self.storage.conn)
+        with self.assertRaises(sqlite3.OperationalError):
+            reader.execute("DELETE FROM messages")
+
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(
+                (self.storage._get_read_connection(), self.storage.get_message("1001"))
+            )
+        )
+        thread.start()
+        thread.join()
+        other_reader, message = results[0]
+        self.assertIsNot(other_reader, reader)
+        self.assertEqual(message.content, "message 1")
+
+    def test_read_connection_closed_when_thread_exits(self):
+        """A thread's read connection is closed once the thread is gone, not kept until close()."""
+        self.storage.save_message(self._make_message(1))
+        reader = self.storage._get_read_connection()
+
+        readers = []
+        for _ in range(3):
+            thread = threading.Thread(target=lambda: readers.append(self.storage._get_read_connection()))
+            thread.start()
+            thread.join()
+        del thread
+        gc.collect()
+
+        self.assertEqual(self.storage._read_conns, {reader})
+        for conn in readers:
+            with self.assertRaises(sqlite3.ProgrammingError):
+                conn.execute("SELECT 1")
+        self.assertEqual(self.storage.get_message("1001").content, "message 1")
+
+    def test_connection_pragmas(self):
+        """WAL with synchronous=NORMAL is the default journaling setup, on 8 KiB pages."""
+        self.assertEqual(self.storage.conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(self.storage.conn.execute("PRAGMA synchronous").fetchone()[0], 1)
+        self.assertEqual(self.storage.conn.execute("PRAGMA page_size").fetchone()[0], 8192)
+
+    def test_in_memory_database(self):
+        """An in-memory database skips WAL and honours the synchronous setting."""
+        storage = SQLiteStorageService(synchronous="off")
+        storage.set_store_root_dir(self.temp_dir.name, ":memory:")
+        storage.initialize()
+        try:
+            self.assertEqual(storage.conn.execute("PRAGMA journal_mode").fetchone()[0], "memory")
+            self.assertEqual(storage.conn.execute("PRAGMA synchronous").fetchone()[0], 0)
+            self.assertTrue(storage.save_message(self._make_message(1)))
+            self.assertEqual(len(storage.get_messages()), 1)
+        finally:
+            storage.close()
+
+    def test_durability_tiers(self):
+        """Each durability tier maps to its journal mode and synchronous level."""
+        storage = SQLiteStorageService(durability=Durability.FULL)
+        storage.set_store_root_dir(self.temp_dir.name, "full.db")
+        storage.initialize()
+        try:
+            self.assertEqual(storage.conn.execute("PRAGMA journal_mode").fetchone()[0], "delete")
+            self.assertEqual(storage.conn.execute("PRAGMA synchronous").fetchone()[0], 2)
+        finally:
+            storage.close()
+
+    def test_durability_from_environment(self):
+        """Without an explicit tier, TICOS_STORAGE_DURABILITY picks one and NORMAL is the fallback."""
+        with mock.patch.dict(os.environ, {"TICOS_STORAGE_DURABILITY": "FULL"}):
+            self.assertEqual(SQLiteStorageService().durability, Durability.FULL)
+            self.assertEqual(SQLiteStorageService(durability=Durability.NONE).durability, Durability.NONE)
+        with mock.patch.dict(os.environ, {"TICOS_STORAGE_DURABILITY": "bogus"}):
+            self.assertEqual(SQLiteStorageService().journal_mode, "WAL")
+
+    def _write_corrupt_database(self, name: str) -> str:
+        path = os.path.join(self.temp_dir.name, name)
+        with open(path, "wb") as f:
+            f.write(b"definitely not a sqlite database" * 100)
+        return path
+
+    def test_relaxed_durability_recreates_corrupt_database(self):
+        """Best-effort tiers replace an unreadable database with a fresh one."""
+        path = self._write_corrupt_database("corrupt.db")
+        storage = SQLiteStorageService(durability=Durability.RELAXED)
+        storage.set_store_root_dir(self.temp_dir.name, path)
+        storage.initialize()
+        try:
+            self.assertTrue(storage.save_message(self._make_message(1)))
+            self.assertEqual(len(storage.get_messages()), 1)
+        finally:
+            storage.close()
+
+    def test_normal_durability_keeps_corrupt_database(self):
+        """The default tier never deletes an unreadable database."""
+        path = self._write_corrupt_database("corrupt.db")
+        storage = SQLiteStorageService()
+        storage.set_store_root_dir(self.temp_dir.name, path)
+        with self.assertRaises(sqlite3.DatabaseError):
+            storage.initialize()
+        self.assertTrue(os.path.exists(path))
+
+
+class TestSQLiteStorageServiceWriteBehind(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.storage = SQLiteStorageService(write_behind=True)
+        self.storage.set_store_root_dir(self.temp_dir.name)
+        self.storage.initialize()
+
+    def tearDown(self):
+        self.storage.close()
+        self.temp_dir.cleanup()
+
+    def test_reads_see_buffered_saves(self):
+        """Saves return before committing, but a following read still sees them."""
+        for i in range(5):
+            self.assertTrue(
+                self.storage.save_message(
+                    Message(
+                        id=str(1000 + i),
+                        role=MessageRole.USER,
+                        content=f"message {i}",
+                        datetime=f"2024-01-01 00:00:{i:02d}",
+                    )
+                )
+            )
+
+        stored = self.storage.get_messages(0, 10, desc=False)
+        self.assertEqual([m.id for m in stored], [str(1000 + i) for i in range(5)])
+
+    def test_close_flushes_buffered_saves(self):
+        """Closing commits anything still buffered."""
+        memory = Memory(type=MemoryType.LONG_TERM, content="later", datetime="2024-01-01 00:00:00")
+        self.assertTrue(self.storage.save_memory(memory))
+        self.storage.close()
+
+        reopened = SQLiteStorageService()
+        reopened.set_store_root_dir(self.temp_dir.name)
+        reopened.initialize()
+        try:
+            self.assertEqual(reopened.get_latest_memory()["content"], "later")
+        finally:
+            reopened.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,12 +6,15 @@ import requests
 import shutil
 import os
 import json
+import logging
+import tempfile
 import toml
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, Any
+from unittest import mock
 
-from ticos_client import TicosClient, MessageRole, SaveMode
+from ticos_client import DefaultMessageHandler, Message, TicosClient, MessageRole, SaveMode
 from ticos_client.config import ConfigService
 
 
@@ -152,6 +155,31 @@ class TestTicosClient(unittest.TestCase):
             # Clean up the event loop
             loop.close()
 
+    def test_stop_with_connected_client(self):
+        """stop() closes connected clients and lets the server thread exit."""
+        server = self.client.server
+        server_thread = self.client.server_thread
+        closed = []
+
+        class ConnectedWebSocket:
+            async def close(self):
+                # Like a real close handshake, give control back to the loop so the
+                # endpoint's finally unregisters this connection meanwhile
+                asyncio.get_running_loop().create_task(server._unregister_websocket(self))
+                await asyncio.sleep(0.05)
+                closed.append(self)
+
+        connection = ConnectedWebSocket()
+        server.websocket_connections.append(connection)
+
+        started = time.monotonic()
+        self.client.stop()
+
+        self.assertLess(time.monotonic() - started, 5, "stop() waited on a blocked server loop")
+        self.assertFalse(server_thread.is_alive(), "Server thread did not exit")
+        self.assertEqual(closed, [connection])
+        self.assertEqual(server.websocket_connections, [])
+
     def test_invalid_message(self):
         """Test sending an invalid message."""
         # Should return False for invalid messages
@@ -237,5 +265,290 @@ class TestTicosClient(unittest.TestCase):
             loop.close()
 
 
+class TestTicosClientMessageHandling(unittest.TestCase):
+    """TicosClient logic exercised against a mocked storage and server, without starting either."""
+
+    def setUp(self):
+        # A throwaway home directory holding the configuration ConfigService loads
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.config_dir = Path(self.temp_dir.name) / ".config" / "ticos"
+        self.config_dir.mkdir(parents=True)
+        with open(self.config_dir / "config.toml", "w") as f:
+            toml.dump({"api": {"api_key": "test_api_key"}}, f)
+        self._write_session_config(enable_memory_generation="client", history_conversation_length=4)
+
+        home = mock.patch.object(Path, "home", return_value=Path(self.temp_dir.name))
+        home.start()
+        self.addCleanup(home.stop)
+        http_util = mock.patch("ticos_client.ticos_client.HttpUtil")
+        self.http_util = http_util.start()
+        self.addCleanup(http_util.stop)
+
+        self.client = TicosClient(port=0)
+        self.storage = mock.Mock()
+        self.storage.get_context_bundle.return_value = ([], None)
+        self.client.storage = self.storage
+        self.client.server = mock.Mock()
+
+    def _write_session_config(self, **model):
+        with open(self.config_dir / "session_config", "w") as f:
+            json.dump({"model": model}, f)
+
+    def _function_call(self, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "type": "response.output_item.done",
+            "item": {"type": "function_call", "name": name, "arguments": json.dumps(arguments)},
+        }
+
+    def test_handle_message_without_consumers(self):
+        """With no handler and no storage, messages are declined before any dispatch."""
+        self.client.storage = None
+        lookups = []
+
+        class RecordingMessage(dict):
+            def get(self, key, default=None):
+                lookups.append(key)
+                return super().get(key, default)
+
+        message = RecordingMessage(self._function_call("motion", {"a": 1}))
+        self.assertFalse(self.client.handle_message(message))
+        self.assertEqual(lookups, [])
+
+        # Setting a handler turns the full pass back on
+        received = []
+        self.client.set_motion_handler(received.append)
+        self.assertTrue(self.client.handle_message(self._function_call("motion", {"a": 1})))
+        self.assertEqual(received, [{"a": 1}])
+
+    def test_handle_message_with_assigned_handler(self):
+        """Handlers assigned to the public attributes directly receive messages too."""
+        self.client.storage = None
+        received = []
+        self.client.message_handler = received.append
+
+        message = self._function_call("other", {})
+        self.assertTrue(self.client.handle_message(message))
+        self.assertEqual(received, [message])
+
+    def test_handle_message_stores_without_handlers(self):
+        """Storage alone still receives messages when no handler is set."""
+        self.client.handle_message({"type": "response.audio_transcript.delta", "item_id": "a1", "delta": "Hi"})
+        self.assertFalse(self.client.handle_message({"type": "response.done"}))
+
+        saved = self.storage.save_message.call_args[0][0]
+        self.assertEqual((saved.role, saved.content, saved.item_id), (MessageRole.ASSISTANT, "Hi", "a1"))
+
+    def test_memory_generation_coalesced(self):
+        """A run is declined while one is in flight and for the minimum interval after it."""
+        client = self.client
+        scheduled = []
+        client._run_in_background = lambda func, name: scheduled.append(func) or mock.Mock()
+
+        self.assertTrue(client._schedule_memory_generation())
+        self.assertFalse(client._schedule_memory_generation())
+        self.assertEqual(len(scheduled), 1)
+
+        # Finishing the run starts the minimum interval
+        with mock.patch.object(client, "_run_memory_generation"):
+            scheduled[0]()
+        self.assertFalse(client._memory_generation_in_flight)
+        self.assertFalse(client._schedule_memory_generation())
+
+        client._memory_generation_finished -= client.MEMORY_GENERATION_MIN_INTERVAL
+        self.assertTrue(client._schedule_memory_generation())
+        self.assertEqual(len(scheduled), 2)
+
+    def test_memory_generation_not_scheduled_when_pool_full(self):
+        """A run dropped by a full pool doesn't leave the in-flight flag set."""
+        self.client._run_in_background = lambda func, name: None
+
+        self.assertFalse(self.client._schedule_memory_generation())
+        self.assertFalse(self.client._memory_generation_in_flight)
+
+    def test_message_counter_kept_while_generation_declined(self):
+        """Text messages keep counting while generation is declined and reset once it is scheduled."""
+        client = self.client
+        client._memory_generation_in_flight = True
+        with mock.patch.object(client, "_run_in_background", return_value=mock.Mock()) as run:
+            for item_id in ("a1", "a2", "a3"):
+                client.handle_message({"type": "response.audio_transcript.delta", "item_id": item_id, "delta": "Hi"})
+            client.handle_message({"type": "response.done"})
+            self.assertEqual(client.message_counter, 3)
+            run.assert_not_called()
+
+            client._memory_generation_in_flight = False
+            client.handle_message({"type": "response.audio_transcript.delta", "item_id": "a4", "delta": "Hi"})
+            client.handle_message({"type": "response.done"})
+            self.assertEqual(client.message_counter, 0)
+            run.assert_called_once_with(client._generate_memory_and_update_session, "memory_generation")
+
+    def _message(self, message_id: str, role: MessageRole, content: str) -> Message:
+        return Message(
+            id=message_id, role=role, content=content, item_id=f"item-{message_id}",
+            datetime="2024-01-01 00:00:00",
+        )
+
+    def test_memory_generation_skipped_without_new_messages(self):
+        """The summarization API is only called when a message arrived since the last memory."""
+        client = self.client
+        client.running = True
+        self.storage.save_memory.return_value = True
+        summarize = self.http_util.summarize_conversation
+        summarize.return_value = "summary"
+
+        self.assertIsNone(client._generate_memory_from([], ""))
+        summarize.assert_not_called()
+
+        messages = [
+            self._message("1", MessageRole.USER, "hi"),
+            self._message("2", MessageRole.ASSISTANT, "hello"),
+        ]
+        self.assertEqual(client._generate_memory_from(messages, ""), "summary")
+        self.assertIsNone(client._generate_memory_from(list(messages), "summary"))
+        self.assertEqual(summarize.call_count, 1)
+
+        # The newest message changing, here a longer transcript, counts as new
+        messages[-1] = self._message("2", MessageRole.ASSISTANT, "hello there")
+        self.assertEqual(client._generate_memory_from(messages, "summary"), "summary")
+        self.assertEqual(summarize.call_count, 2)
+
+    def test_memory_generation_retried_when_memory_not_saved(self):
+        """Messages stay new until a memory covering them is actually saved."""
+        self.client.running = True
+        self.storage.save_memory.return_value = False
+        summarize = self.http_util.summarize_conversation
+        summarize.return_value = "summary"
+
+        messages = [self._message("1", MessageRole.USER, "hi")]
+        self.client._generate_memory_from(messages, "")
+        self.client._generate_memory_from(messages, "")
+        self.assertEqual(summarize.call_count, 2)
+
+    def test_user_audio_message_saved_then_transcribed(self):
+        """A user audio turn is stored when created and filled in when its transcript arrives."""
+        from ticos_client.storage import SQLiteStorageService
+
+        storage = SQLiteStorageService()
+        storage.set_store_root_dir(self.temp_dir.name)
+        storage.initialize()
+        self.addCleanup(storage.close)
+        self.client.storage = storage
+        conversation = []
+        self.client.set_conversation_handler(lambda *args: conversation.append(args))
+
+        self.client.handle_message({
+            "type": "conversation.item.created",
+            "item": {"type": "message", "role": "user", "id": "u1", "content": [{"type": "input_audio"}]},
+        })
+        messages, _ = storage.get_context_bundle(10)
+        self.assertEqual([(m.role, m.content, m.item_id) for m in messages], [(MessageRole.USER, "", "u1")])
+        message_id = messages[0].id
+
+        self.client.handle_message({
+            "type": "conversation.item.input_audio_transcription.completed",
+            "item_id": "u1",
+            "transcript": "hi there",
+        })
+        messages, _ = storage.get_context_bundle(10)
+        self.assertEqual([(m.id, m.content) for m in messages], [(message_id, "hi there")])
+
+        # A transcript for an unknown item changes nothing
+        self.client.handle_message({
+            "type": "conversation.item.input_audio_transcription.completed",
+            "item_id": "unknown",
+            "transcript": "lost",
+        })
+        self.assertEqual([m.content for m in storage.get_messages(0, 10)], ["hi there"])
+        self.assertEqual(
+            conversation, [("u1", MessageRole.USER, ""), ("u1", MessageRole.USER, "hi there")]
+        )
+
+    def test_reload_config_refreshes_cached_values(self):
+        """reload_config() rereads the configuration and refreshes the values cached from it."""
+        client = self.client
+        self.assertEqual((client.context_rounds, client._client_memory_generation), (4, True))
+        client._session_messages_fingerprint = (("assistant", "hello"),)
+
+        self._write_session_config(enable_memory_generation="server", history_conversation_length=8)
+        client.reload_config()
+
+        self.assertEqual((client.context_rounds, client._client_memory_generation), (8, False))
+        self.assertIsNone(client._session_messages_fingerprint)
+
+    def test_reload_config_failure_keeps_cached_values(self):
+        """A configuration that fails to load raises and leaves the cached values alone."""
+        (self.config_dir / "config.toml").unlink()
+
+        with self.assertRaises(FileNotFoundError):
+            self.client.reload_config()
+        self.assertEqual((self.client.context_rounds, self.client._client_memory_generation), (4, True))
+
+    def test_message_ids_continue_after_highest_stored_id(self):
+        """IDs are seeded from the highest stored ID, not from the newest message."""
+        from ticos_client.storage import SQLiteStorageService
+
+        # A run whose IDs got ahead of the clock, then a later row with a lower ID
+        ahead = int(time.time()) + 1000
+        storage = SQLiteStorageService()
+        storage.set_store_root_dir(None)
+        storage.initialize()
+        for message_id, second in ((ahead, 1), (ahead - 500, 2)):
+            message = self._message(str(message_id), MessageRole.USER, "hi")
+            message.datetime = f"2024-01-01 00:00:{second:02d}"
+            storage.save_message(message)
+        storage.close()
+        self.addCleanup(storage.close)
+
+        self.client.enable_local_storage(storage)
+        self.assertEqual(int(self.client._generate_message_id()), ahead + 1)
+
+    def test_message_ids_from_clock_for_storage_without_max_id(self):
+        """Storages without get_max_message_id(), duck-typed or on the Protocol default, start from the clock."""
+        from ticos_client.storage import StorageService
+
+        class OldStorage(StorageService):
+            def set_store_root_dir(self, tf_root_dir, db_filename=None):
+                pass
+
+            def get_messages(self, offset=0, limit=100, desc=True):
+                return []
+
+        class DuckTypedStorage:
+            def set_store_root_dir(self, tf_root_dir, db_filename=None):
+                pass
+
+            def initialize(self):
+                pass
+
+            def get_messages(self, offset=0, limit=100, desc=True):
+                return []
+
+        for storage in (OldStorage(), DuckTypedStorage()):
+            self.client.enable_local_storage(storage)
+            self.assertIs(self.client.storage, storage)
+            self.assertLess(abs(int(self.client._generate_message_id()) - time.time()), 60)
+
+
+class TestDefaultMessageHandler(unittest.TestCase):
+    def test_logs_messages_at_debug_level_only(self):
+        """Messages are logged, not printed, and only formatted when debug logging is on."""
+        handler = DefaultMessageHandler()
+        message = {"type": "response.done"}
+        logger = logging.getLogger("ticos_client.ticos_client")
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.INFO)
+
+        with mock.patch("ticos_client.ticos_client.json_dumps_indented") as dumps, \
+                mock.patch("builtins.print") as printed:
+            handler.handle_message(message)
+        dumps.assert_not_called()
+        printed.assert_not_called()
+
+        with self.assertLogs("ticos_client.ticos_client", level="DEBUG") as logs:
+            handler.handle_message(message)
+        self.assertIn('"type": "response.done"', logs.output[0])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,31 @@
+import json
+import unittest
+from unittest import mock
+
+from ticos_client import utils
+from ticos_client.utils import json_dumps, json_dumps_indented
+
+
+class TestJsonDumps(unittest.TestCase):
+    def _check_both_encoders(self, obj, expected: str):
+        """json_dumps gives the same text with orjson and with the json fallback."""
+        self.assertEqual(json_dumps(obj), expected)
+        with mock.patch.object(utils, "orjson", None):
+            self.assertEqual(json_dumps(obj), expected)
+
+    def test_non_str_keys(self):
+        """Non-str dict keys become strings, as json does."""
+        self._check_both_encoders({1: "a", "b": {2: "c"}}, '{"1":"a","b":{"2":"c"}}')
+
+    def test_big_integers(self):
+        """Integers beyond 64 bits, which orjson rejects, are still encoded."""
+        self._check_both_encoders({"n": 2 ** 70}, '{"n":%d}' % 2 ** 70)
+        self.assertEqual(json.loads(json_dumps_indented({"n": 2 ** 70})), {"n": 2 ** 70})
+
+    def test_non_ascii(self):
+        """Non-ASCII text is written as UTF-8, not escaped."""
+        self._check_both_encoders({"text": "你好"}, '{"text":"你好"}')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,7 +11,7 @@ from .models import (
 from .storage import StorageService, SQLiteStorageService
 from .server import UnifiedServer
 from .ticos_client_interface import MessageCallbackInterface
-from .enums import SaveMode
+from .enums import SaveMode, Durability
 
 __all__ = [
     "TicosClient",
@@ -27,4 +27,5 @@ __all__ = [
     "SQLiteStorageService",
     "UnifiedServer" "MessageCallbackInterface",
     "SaveMode",
+    "Durability",
 ]
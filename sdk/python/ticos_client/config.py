@@ -5,11 +5,14 @@ import json
 import logging
 import requests
 from pathlib import Path
-from typing import Optional, Any, Dict, Union
+from typing import Callable, Optional, Any, Dict, Union
 from .enums import SaveMode
 
 logger = logging.getLogger(__name__)
 
+# Shared so retries and later fetches reuse the keep-alive connection to the API
+_http_session = requests.Session()
+
 
 class ConfigService:
     """Configuration service for Ticos client."""
@@ -33,6 +36,8 @@ class ConfigService:
         self._config = None
         self._session_config = None
         self._server_config = None
+        # Called without arguments each time initialize() has (re)loaded the configuration
+        self._reload_listeners = []
         self.initialize()
 
     def initialize(self) -> None:
@@ -61,6 +66,19 @@ class ConfigService:
             logger.error(f"Failed to initialize config service: {e}")
             raise
 
+        for listener in self._reload_listeners:
+            listener()
+
+    def add_reload_listener(self, listener: Callable[[], None]) -> None:
+        """
+        Register a callback run after every later initialize(), so callers caching
+        configuration values can refresh them.
+
+        Args:
+            listener: Function called without arguments
+        """
+        self._reload_listeners.append(listener)
+
     def _load_session_config(self) -> None:
         """Load the session configuration file."""
         try:
@@ -132,7 +150,7 @@ class ConfigService:
         last_error = None
         for attempt in range(max_retries + 1):
             try:
-                response = requests.get(
+                response = _http_session.get(
                     url,
                     headers=headers,
                     timeout=timeout
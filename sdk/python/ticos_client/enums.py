@@ -6,3 +6,12 @@ class SaveMode(Enum):
 
     INTERNAL = "internal"
     EXTERNAL = "external"
+
+
+class Durability(Enum):
+    """Crash-safety tier of the SQLite storage, trading durability for write speed."""
+
+    FULL = "full"
+    NORMAL = "normal"
+    RELAXED = "relaxed"
+    NONE = "none"
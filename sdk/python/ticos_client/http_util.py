@@ -1,4 +1,5 @@
 import json
+import threading
 import httpx
 from typing import List, Dict, Any, Optional
 from datetime import datetime
@@ -7,6 +8,24 @@ from .config import ConfigService
 
 logger = logging.getLogger(__name__)
 
+# One client shared by every request, so repeated calls to the same API host
+# reuse pooled keep-alive connections instead of paying a new TCP and TLS handshake
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+
+def _get_client() -> httpx.Client:
+    """Return the shared HTTP client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    follow_redirects=True,
+                    limits=httpx.Limits(max_connections=32, max_keepalive_connections=8),
+                )
+    return _client
+
 
 class HttpUtil:
     """Utility class for making HTTP requests"""    
@@ -60,14 +79,13 @@ class HttpUtil:
             }
             
             # Send POST request to update variables using httpx with redirect support
-            with httpx.Client(follow_redirects=True) as client:
-                response = client.post(
-                    api_url,
-                    json=variables,
-                    headers=headers,
-                    timeout=30.0,
-                    follow_redirects=True
-                )
+            response = _get_client().post(
+                api_url,
+                json=variables,
+                headers=headers,
+                timeout=30.0,
+                follow_redirects=True
+            )
             
             if response.status_code == 200:
                 logger.info(f"Successfully updated variables with priority '{priority}'")
@@ -182,35 +200,34 @@ class HttpUtil:
             )
 
             try:
-                with httpx.Client(follow_redirects=True) as client:
-                    response = client.post(
-                        api_url,
-                        json=request_body,
-                        headers=headers,
-                        timeout=180.0,  # Increased timeout to 180 seconds
-                        follow_redirects=True
-                    )
+                response = _get_client().post(
+                    api_url,
+                    json=request_body,
+                    headers=headers,
+                    timeout=180.0,  # Increased timeout to 180 seconds
+                    follow_redirects=True
+                )
 
-                    if response.status_code == 200:
-                        response_data = response.json()
-
-                        summary_array = response_data.get("summary", [])
-                        # Join all summary parts with spaces
-                        summary = " ".join(summary_array)
-                        logger.debug(f"Generated summary: {summary}")
-                        return summary
-                    else:
-                        error_msg = (
-                            f"Failed to get summary. Status code: {response.status_code}"
-                        )
-                        try:
-                            error_details = response.json()
-                            error_msg += f"\nError details: {json.dumps(error_details, indent=2, ensure_ascii=False)}"
-                        except:
-                            error_msg += f"\nResponse text: {response.text[:500]}"
-
-                        logger.warning(error_msg)
-                        return None
+                if response.status_code == 200:
+                    response_data = response.json()
+
+                    summary_array = response_data.get("summary", [])
+                    # Join all summary parts with spaces
+                    summary = " ".join(summary_array)
+                    logger.debug(f"Generated summary: {summary}")
+                    return summary
+                else:
+                    error_msg = (
+                        f"Failed to get summary. Status code: {response.status_code}"
+                    )
+                    try:
+                        error_details = response.json()
+                        error_msg += f"\nError details: {json.dumps(error_details, indent=2, ensure_ascii=False)}"
+                    except:
+                        error_msg += f"\nResponse text: {response.text[:500]}"
+
+                    logger.warning(error_msg)
+                    return None
 
             except httpx.RequestError as e:
                 logger.error(f"Request failed: {str(e)}", exc_info=True)
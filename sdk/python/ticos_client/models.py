@@ -1,8 +1,9 @@
-from datetime import datetime
 from typing import Dict, Any, Optional, List
 from pydantic import BaseModel, Field
 from enum import Enum
 
+from .utils import now_str
+
 
 class MessageRole(str, Enum):
     USER = "user"
@@ -16,9 +17,7 @@ class Message(BaseModel):
     content: str
     item_id: Optional[str] = None  # Added item_id field for tracking conversation items
     user_id: str = "nobody"  # User identifier, default to "nobody"
-    datetime: str = Field(
-        default_factory=lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    )
+    datetime: str = Field(default_factory=now_str)
 
 
 class MemoryType(str, Enum):
@@ -31,9 +30,7 @@ class Memory(BaseModel):
     type: MemoryType
     content: str
     user_id: str = "nobody"  # User identifier, default to "nobody"
-    datetime: str = Field(
-        default_factory=lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    )
+    datetime: str = Field(default_factory=now_str)
 
 
 class MessageRequest(BaseModel):
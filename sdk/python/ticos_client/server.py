@@ -8,6 +8,12 @@ from typing import Dict, Any, Optional, Callable, List, Union
 
 import uvicorn
 
+try:
+    # Installed with uvicorn[standard] on platforms that support it
+    import uvloop
+except ImportError:
+    uvloop = None
+
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.requests import Request
@@ -24,10 +30,37 @@ from .models import (
 )
 from .storage import StorageService
 from .ticos_client_interface import MessageCallbackInterface
+from .utils import json_dumps, json_loads
 
 logger = logging.getLogger(__name__)
 
 
+def _run_event_loop(coro):
+    """
+    Run a coroutine to completion on a new event loop like asyncio.run(), using
+    uvloop when it is installed.
+
+    The server runs its own loop rather than going through uvicorn.run(), so the
+    uvicorn loop setting doesn't apply; uvloop is picked here instead, without
+    installing its policy, which would change the loop of every thread in the process.
+    """
+    if uvloop is None:
+        return asyncio.run(coro)
+    if hasattr(asyncio, "Runner"):  # Python 3.11+
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            return runner.run(coro)
+    loop = uvloop.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        try:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+
 class StartupErrorLogHandler(logging.Handler):
     def __init__(self, unified_server_instance):
         super().__init__()
@@ -45,6 +78,20 @@ class StartupErrorLogHandler(logging.Handler):
                 self.unified_server._captured_startup_error_log = msg
 
 
+class _ReadyNotifyingServer(uvicorn.Server):
+    """uvicorn.Server that sets an event once its startup sequence has succeeded"""
+
+    def __init__(self, config: uvicorn.Config, ready: threading.Event):
+        super().__init__(config)
+        self._ready = ready
+
+    async def startup(self, sockets=None) -> None:
+        await super().startup(sockets=sockets)
+        # Failed startups are signalled by run() once it has recorded the error
+        if self.started:
+            self._ready.set()
+
+
 class UnifiedServer:
     """Unified server that handles both HTTP and WebSocket connections."""
 
@@ -57,6 +104,12 @@ class UnifiedServer:
         self.startup_error_message: Optional[str] = None
         self._captured_startup_error_log: Optional[str] = None
         self._server: Optional[uvicorn.Server] = None # Will hold the uvicorn.Server instance
+        # Set once uvicorn is listening, or once run() has failed and set startup_error_message
+        self.ready = threading.Event()
+        # The event loop serving uvicorn while run() is active, for submitting coroutines from other threads
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # Messages waiting to be broadcast, consumed in order by a single task on self.loop
+        self._broadcast_queue: Optional[asyncio.Queue] = None
         self.port = port
         self.storage = storage_service
         self.ticos_client = None
@@ -66,6 +119,7 @@ class UnifiedServer:
         self.websocket_connections: List[WebSocket] = []
         self.websocket_lock = threading.Lock()
         self._should_exit = False
+        self._is_running = False
         self.message_callback = message_callback
 
         # Ensure message_callback is properly initialized
@@ -106,7 +160,7 @@ class UnifiedServer:
                         # Handle text messages (JSON)
                         if "text" in message:
                             try:
-                                data = json.loads(message["text"])
+                                data = json_loads(message["text"])
                                 logger.debug(
                                     f"[WebSocket] Parsed message data: {json.dumps(data, default=str, ensure_ascii=False, indent=2)}"
                                 )
@@ -144,7 +198,7 @@ class UnifiedServer:
 
                                     try:
                                         # Try to parse the JSON
-                                        data = json.loads(json_str)
+                                        data = json_loads(json_str)
                                         logger.debug(
                                             f"[WebSocket] Parsed binary JSON: {json.dumps(data, ensure_ascii=False, indent=2)}"
                                         )
@@ -277,12 +331,13 @@ class UnifiedServer:
             logger.error(f"Error handling message: {str(e)}", exc_info=True)
             return False
 
-    async def broadcast_message(self, message: Dict[str, Any]) -> bool:
+    async def broadcast_message(self, message: Union[Dict[str, Any], str]) -> bool:
         """
         Broadcast a message to all connected WebSocket clients.
 
         Args:
-            message: The message to broadcast
+            message: The message to broadcast, or its JSON text. It is encoded once
+                     and the same text is sent to every client.
 
         Returns:
             bool: True if the message was sent to at least one client
@@ -290,43 +345,91 @@ class UnifiedServer:
         if not self.websocket_connections:
             return False
 
-        message_str = json.dumps(message)
+        message_str = message if isinstance(message, str) else json_dumps(message)
         sent_to_any = False
+        # Send to a snapshot without holding the lock: a send can wait on the
+        # client, and (un)registering runs on this same loop thread
         with self.websocket_lock:
-            for connection in self.websocket_connections.copy():
-                try:
-                    await connection.send_text(message_str)
-                    sent_to_any = True  # At least one send succeeded
-                except Exception as e:
-                    logger.error(f"Error sending WebSocket message: {e}")
-                    # Remove the connection if there's an error
-                    try:
-                        await self._unregister_websocket(connection)
-                    except Exception as e:
-                        logger.error(f"Error unregistering WebSocket: {e}")
+            connections = self.websocket_connections.copy()
+        failed = []
+        for connection in connections:
+            try:
+                await connection.send_text(message_str)
+                sent_to_any = True  # At least one send succeeded
+            except Exception as e:
+                logger.error(f"Error sending WebSocket message: {e}")
+                failed.append(connection)
+
+        # Remove the connections that errored
+        for connection in failed:
+            try:
+                await self._unregister_websocket(connection)
+            except Exception as e:
+                logger.error(f"Error unregistering WebSocket: {e}")
 
         return sent_to_any
 
+    def enqueue_broadcast(self, message: Union[Dict[str, Any], str]) -> bool:
+        """
+        Queue a message for broadcasting from any thread without waiting for it to be sent.
+
+        Args:
+            message: The message to broadcast, or its JSON text
+
+        Returns:
+            bool: True if the message was queued, False if the server is not running
+        """
+        loop = self.loop
+        if loop is None:
+            return False
+        try:
+            loop.call_soon_threadsafe(self._broadcast_queue.put_nowait, message)
+            return True
+        except RuntimeError:
+            # The loop closed between the check and the call
+            return False
+
+    async def _broadcast_worker(self):
+        """Broadcast queued messages one at a time, so clients receive them in send order"""
+        while True:
+            message = await self._broadcast_queue.get()
+            try:
+                await self.broadcast_message(message)
+            except Exception as e:
+                logger.error(f"Error broadcasting message: {e}", exc_info=True)
+
     def is_running(self) -> bool:
         """Check if the server is running"""
         # In a real implementation, we would check if the server is actually running
         # For now, we'll just return True if the server has been started
-        return hasattr(self, "_is_running") and self._is_running
+        return self._is_running
 
     async def _serve_uvicorn(self):
         """Configures and runs the uvicorn server."""
+        self._broadcast_queue = asyncio.Queue()
+        broadcast_task = asyncio.create_task(self._broadcast_worker())
+        # Published last: enqueue_broadcast() takes a set loop to mean the queue exists
+        self.loop = asyncio.get_running_loop()
+        # Compression costs CPU on every frame for clients that are normally local
         config = uvicorn.Config(
-            self.app, host="0.0.0.0", port=self.port, log_level="info"
+            self.app,
+            host="0.0.0.0",
+            port=self.port,
+            log_level="info",
+            ws_per_message_deflate=False,
         )
         # self._server is the uvicorn.Server instance
         # It's crucial that self._server is assigned before await self._server.serve()
         # so TicosClient can potentially inspect it even if serve() exits quickly.
-        self._server = uvicorn.Server(config)
+        self._server = _ReadyNotifyingServer(config, self.ready)
         
         # The self._server.started flag will be set by uvicorn internally 
         # if its startup sequence (binding, etc.) is successful, 
         # before serve() blocks for the main loop or exits due to error.
-        await self._server.serve() # This can raise SystemExit if startup fails critically
+        try:
+            await self._server.serve() # This can raise SystemExit if startup fails critically
+        finally:
+            broadcast_task.cancel()
 
     def run(self):
         """Runs the FastAPI server and handles startup error detection."""
@@ -334,14 +437,15 @@ class UnifiedServer:
         self._should_exit = False
         self.startup_error_message = None # Reset for this run
         self._captured_startup_error_log = None # Reset for this run
+        self.ready.clear()
 
         uvicorn_error_logger = logging.getLogger("uvicorn.error")
         log_handler = StartupErrorLogHandler(self)
         uvicorn_error_logger.addHandler(log_handler)
 
         try:
-            asyncio.run(self._serve_uvicorn())
-            # If asyncio.run completes without SystemExit, uvicorn's serve() completed.
+            _run_event_loop(self._serve_uvicorn())
+            # If the loop completes without SystemExit, uvicorn's serve() completed.
             # This usually means a clean shutdown after successful run.
             if self._server and self._server.started:
                 logger.info(f"Uvicorn server on port {self.port} shut down gracefully.")
@@ -349,7 +453,7 @@ class UnifiedServer:
                 # This case implies serve() returned but server wasn't 'started', e.g. lifespan.shutdown() called early
                 self.startup_error_message = f"Server on port {self.port} exited without confirming startup and no specific error was logged."
                 logger.warning(self.startup_error_message)
-                if hasattr(self.message_callback, 'handle_message') and self.message_callback:
+                if self.message_callback:
                     self.message_callback.handle_message({
                         'code': 'EXECUTER_ERROR',
                         'message': self.startup_error_message,
@@ -372,7 +476,7 @@ class UnifiedServer:
                     self.startup_error_message = f"Server critical startup error on port {self.port} (e.g., port in use) and exited."
                 
                 logger.error(self.startup_error_message)
-                if hasattr(self.message_callback, 'handle_message') and self.message_callback:
+                if self.message_callback:
                     self.message_callback.handle_message({
                         'code': 'EXECUTER_ERROR',
                         'message': self.startup_error_message,
@@ -385,13 +489,15 @@ class UnifiedServer:
             # Other unexpected errors during server run or _serve_uvicorn setup
             self.startup_error_message = f"Server runtime error on port {self.port}: {str(e)}"
             logger.error(self.startup_error_message, exc_info=True)
-            if hasattr(self.message_callback, 'handle_message') and self.message_callback:
+            if self.message_callback:
                 self.message_callback.handle_message({
                     'code': 'EXECUTER_ERROR',
                     'message': self.startup_error_message,
                     'type': 'health.status'
                 })
         finally:
+            self.loop = None
+            self.ready.set()
             self._is_running = False
             self._should_exit = True
 
@@ -400,12 +506,14 @@ class UnifiedServer:
         if self._server:
             self._should_exit = True
             self._server.should_exit = True
-            # Close all WebSocket connections
+            # Close all WebSocket connections outside the lock: closing lets each
+            # endpoint's finally run _unregister_websocket on this same loop thread
             with self.websocket_lock:
-                for connection in self.websocket_connections:
-                    try:
-                        await connection.close()
-                    except Exception as e:
-                        logger.error(f"Error closing WebSocket connection: {e}")
+                connections = self.websocket_connections.copy()
                 self.websocket_connections.clear()
+            for connection in connections:
+                try:
+                    await connection.close()
+                except Exception as e:
+                    logger.error(f"Error closing WebSocket connection: {e}")
             logger.info("Server shutdown complete")
@@ -1,20 +1,446 @@
 import json
 import os
 import sqlite3
+import threading
+import weakref
+from contextlib import nullcontext
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Union
-from datetime import datetime
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Protocol, Tuple, Union
 import logging
-from abc import ABC, abstractmethod
+import operator
+from functools import lru_cache
+from itertools import chain, groupby, islice
+from .enums import Durability
 from .models import Message, Memory, MessageRole, MemoryType
+from .utils import now_str
 
 logger = logging.getLogger(__name__)
 
 
-class StorageService(ABC):
+def _load_driver():
+    """
+    Pick the DB-API module backing SQLiteStorageService.
+
+    pysqlite3 is a drop-in replacement for the standard library module that bundles
+    a newer SQLite build; set TICOS_SQLITE_DRIVER=pysqlite3 to use it when installed.
+    """
+    if os.environ.get("TICOS_SQLITE_DRIVER", "sqlite3") == "pysqlite3":
+        try:
+            from pysqlite3 import dbapi2
+
+            return dbapi2
+        except ImportError:
+            logger.warning("pysqlite3 is not installed, falling back to sqlite3")
+    return sqlite3
+
+
+# Exceptions must come from the same module that opened the connection
+_sqlite = _load_driver()
+
+# Connection tuning applied right after connecting, after the configurable
+# journal_mode and synchronous pragmas. journal_mode is persisted in the database
+# file, the others only last for the lifetime of the connection.
+_CONNECTION_PRAGMAS = (
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=3000",
+)
+# Page size for new databases, read and written as one unit. Twice SQLite's default
+# matches common flash erase blocks and keeps the B-trees of long message content
+# shallower. It only takes effect before the first table is created; an existing
+# database keeps its page size unless it is rebuilt with VACUUM outside WAL mode.
+_SQL_NEW_DATABASE_PAGE_SIZE = "PRAGMA page_size=8192"
+_JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+_SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+# (journal_mode, synchronous) for each durability tier
+_DURABILITY_PRAGMAS = {
+    Durability.FULL: ("DELETE", "FULL"),
+    Durability.NORMAL: ("WAL", "NORMAL"),
+    Durability.RELAXED: ("WAL", "OFF"),
+    Durability.NONE: ("MEMORY", "OFF"),
+}
+
+# Tiers where the history is best-effort, so an unreadable database is recreated
+_RECREATE_ON_CORRUPTION = (Durability.RELAXED, Durability.NONE)
+
+
+def _default_durability() -> Durability:
+    """
+    Durability tier used when none is passed to SQLiteStorageService.
+
+    NORMAL (WAL with synchronous=NORMAL) unless TICOS_STORAGE_DURABILITY names another
+    tier, e.g. "full" for deployments that can't lose the last writes on power loss.
+    """
+    value = os.environ.get("TICOS_STORAGE_DURABILITY")
+    if value:
+        try:
+            return Durability(value.lower())
+        except ValueError:
+            logger.warning("Unknown TICOS_STORAGE_DURABILITY %r, using normal", value)
+    return Durability.NORMAL
+
+
+# Milliseconds since the epoch for a "%Y-%m-%d %H:%M:%S" datetime string. Messages
+# and memories keep the text column for callers and are ordered by this integer copy, which
+# makes for smaller index keys and native integer comparisons
+_SQL_DATETIME_MS = "CAST(ROUND((julianday({}) - 2440587.5) * 86400000) AS INTEGER)"
+
+# Schema DDL, shared by fresh database creation and the migrations
+_SQL_CREATE_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS db_version (
+        id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+"""
+_SQL_SELECT_DB_VERSION = "SELECT version FROM db_version ORDER BY id DESC LIMIT 1"
+_SQL_INSERT_DB_VERSION = "INSERT INTO db_version (version, updated_at) VALUES (?, ?)"
+_SQL_CREATE_TABLES = """
+    CREATE TABLE IF NOT EXISTS messages (
+        id TEXT PRIMARY KEY,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        item_id TEXT,
+        user_id TEXT DEFAULT 'nobody',
+        datetime TEXT NOT NULL,
+        datetime_ms INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS memories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        type TEXT NOT NULL,
+        content TEXT NOT NULL,
+        user_id TEXT DEFAULT 'nobody',
+        datetime TEXT NOT NULL,
+        datetime_ms INTEGER
+    );
+"""
+_INDEX_DDL = (
+    "CREATE INDEX IF NOT EXISTS idx_messages_item_id ON messages(item_id)",
+    # Covers every column except content, so metadata-only pages never touch the table rows
+    "CREATE INDEX IF NOT EXISTS idx_messages_datetime_ms_meta "
+    "ON messages(datetime_ms DESC, id DESC, role, item_id, user_id, datetime)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_role_datetime_ms "
+    "ON messages(role, datetime_ms DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_memories_datetime_ms ON memories(datetime_ms DESC, id DESC)",
+)
+
+
+# Statements are kept as module-level constants so every call passes the same
+# SQL text and hits the connection's prepared statement cache
+_MESSAGE_COLUMNS = "id, role, content, item_id, user_id, datetime"
+_MEMORY_COLUMNS = "id, type, content, user_id, datetime"
+
+# Upsert rather than INSERT OR REPLACE: an existing row is updated in place
+# instead of being deleted and re-inserted along with all its index entries
+_SQL_UPSERT_MESSAGE_TAIL = (
+    " ON CONFLICT(id) DO UPDATE SET role = excluded.role, content = excluded.content, "
+    "item_id = excluded.item_id, user_id = excluded.user_id, datetime = excluded.datetime, "
+    "datetime_ms = excluded.datetime_ms"
+)
+_SQL_INSERT_MESSAGE = (
+    f"INSERT INTO messages ({_MESSAGE_COLUMNS}, datetime_ms) "
+    f"VALUES (?, ?, ?, ?, ?, ?, {_SQL_DATETIME_MS.format('?6')})"
+    f"{_SQL_UPSERT_MESSAGE_TAIL}"
+)
+_SQL_UPDATE_MESSAGE = (
+    "UPDATE messages SET role = ?, content = ?, item_id = ?, user_id = ?, datetime = ?, "
+    f"datetime_ms = {_SQL_DATETIME_MS.format('?5')} WHERE id = ?"
+)
+_SQL_DELETE_MESSAGE = "DELETE FROM messages WHERE id = ?"
+_SQL_SELECT_MESSAGE_BY_ID = f"SELECT {_MESSAGE_COLUMNS} FROM messages WHERE id = ?"
+_SQL_SELECT_MESSAGE_BY_ITEM_ID = f"SELECT {_MESSAGE_COLUMNS} FROM messages WHERE item_id = ?"
+# Highest ID among the purely numeric ones, compared as numbers rather than text
+_SQL_SELECT_MAX_MESSAGE_ID = (
+    "SELECT MAX(CAST(id AS INTEGER)) FROM messages WHERE id != '' AND id NOT GLOB '*[^0-9]*'"
+)
+# The one message update_message_content_by_item_id() resolves an item_id to
+_SQL_SELECT_MESSAGE_ID_ROLE_BY_ITEM_ID = (
+    "SELECT id, role FROM messages WHERE item_id = ? ORDER BY id DESC LIMIT 1"
+)
+_SQL_UPDATE_MESSAGE_CONTENT = "UPDATE messages SET content = ? WHERE id = ?"
+# Text with one trailing Chinese or English punctuation mark removed
+_SQL_NORMALIZE_CONTENT = (
+    "CASE WHEN substr({0}, -1) IN ('。', '，', ',', '.', '?', '!', '？', '！') "
+    "THEN substr({0}, 1, length({0}) - 1) ELSE {0} END"
+)
+# Speech transcripts arrive as growing (or, after a correction, shrinking) user
+# messages. Deletes the message just before ?1 when it is a user message whose
+# normalized content is a strict prefix of the normalized ?2, or the other way round.
+_SQL_DELETE_INCREMENTAL_PREVIOUS = f"""
+    WITH
+        current(content) AS (SELECT {_SQL_NORMALIZE_CONTENT.format('?2')}),
+        previous(id, role, content) AS (
+            SELECT id, role, {_SQL_NORMALIZE_CONTENT.format('content')}
+            FROM messages WHERE id < ?1 ORDER BY id DESC LIMIT 1
+        )
+    DELETE FROM messages WHERE id = (
+        SELECT previous.id FROM previous, current
+        WHERE previous.role = 'user'
+            AND previous.content != current.content
+            AND (substr(current.content, 1, length(previous.content)) = previous.content
+                 OR substr(previous.content, 1, length(current.content)) = current.content)
+    )
+"""
+# WHERE clauses for the optional get_messages() filters, keyed by (has_role, has_since)
+_MESSAGE_FILTERS = {
+    (False, False): "",
+    (True, False): "WHERE role = ? ",
+    (False, True): f"WHERE datetime_ms >= {_SQL_DATETIME_MS.format('?')} ",
+    (True, True): f"WHERE role = ? AND datetime_ms >= {_SQL_DATETIME_MS.format('?')} ",
+}
+
+
+def _paged_message_queries(columns: str) -> Dict[tuple, str]:
+    """Every filter and order combination as a fixed statement, keyed by (has_role, has_since, desc)"""
+    return {
+        (*filters, desc): (
+            f"SELECT {columns} FROM messages {where}"
+            f"ORDER BY datetime_ms {'DESC' if desc else 'ASC'}, id {'DESC' if desc else 'ASC'} "
+            "LIMIT ? OFFSET ?"
+        )
+        for filters, where in _MESSAGE_FILTERS.items()
+        for desc in (True, False)
+    }
+
+
+# Paged reads
+_SQL_SELECT_MESSAGES = _paged_message_queries(_MESSAGE_COLUMNS)
+# Same pages without content, answered from idx_messages_datetime_ms_meta alone when unfiltered
+_MESSAGE_META_COLUMNS = "id, role, '' AS content, item_id, user_id, datetime"
+_SQL_SELECT_MESSAGE_METAS = _paged_message_queries(_MESSAGE_META_COLUMNS)
+# Keyset pages seeking past a (datetime, id) position, keyed by the desc flag
+_SQL_SELECT_MESSAGES_AFTER = {
+    desc: (
+        f"SELECT {_MESSAGE_COLUMNS} FROM messages "
+        f"WHERE (datetime_ms, id) {'<' if desc else '>'} ({_SQL_DATETIME_MS.format('?')}, ?) "
+        f"ORDER BY datetime_ms {'DESC' if desc else 'ASC'}, id {'DESC' if desc else 'ASC'} LIMIT ?"
+    )
+    for desc in (True, False)
+}
+
+_SQL_INSERT_MEMORY = (
+    "INSERT INTO memories (type, content, user_id, datetime, datetime_ms) "
+    f"VALUES (?, ?, ?, ?, {_SQL_DATETIME_MS.format('?4')})"
+)
+# Rows pulled per fetchmany() call when streaming a result set
+_FETCH_ROWS = 64
+
+# Most rows bound to one multi-row INSERT, 600 message parameters stays far below SQLite's variable limit
+_INSERT_BATCH_ROWS = 100
+
+
+@lru_cache(maxsize=None)
+def _sql_insert_messages(count: int) -> str:
+    """_SQL_INSERT_MESSAGE taking count rows of parameters in a single VALUES list"""
+    values = ", ".join(
+        f"(?{n + 1}, ?{n + 2}, ?{n + 3}, ?{n + 4}, ?{n + 5}, ?{n + 6}, "
+        f"{_SQL_DATETIME_MS.format(f'?{n + 6}')})"
+        for n in range(0, count * 6, 6)
+    )
+    return f"INSERT INTO messages ({_MESSAGE_COLUMNS}, datetime_ms) VALUES {values}{_SQL_UPSERT_MESSAGE_TAIL}"
+
+
+@lru_cache(maxsize=None)
+def _sql_insert_memories(count: int) -> str:
+    """_SQL_INSERT_MEMORY taking count rows of parameters in a single VALUES list"""
+    values = ", ".join(
+        f"(?{n + 1}, ?{n + 2}, ?{n + 3}, ?{n + 4}, {_SQL_DATETIME_MS.format(f'?{n + 4}')})"
+        for n in range(0, count * 4, 4)
+    )
+    return f"INSERT INTO memories (type, content, user_id, datetime, datetime_ms) VALUES {values}"
+
+
+_SQL_UPDATE_MEMORY = (
+    "UPDATE memories SET type = ?, content = ?, user_id = ?, datetime = ?, "
+    f"datetime_ms = {_SQL_DATETIME_MS.format('?4')} WHERE id = ?"
+)
+_SQL_DELETE_MEMORY = "DELETE FROM memories WHERE id = ?"
+_SQL_SELECT_MEMORY_BY_ID = f"SELECT {_MEMORY_COLUMNS} FROM memories WHERE id = ?"
+_SQL_SELECT_LATEST_MEMORY = (
+    f"SELECT {_MEMORY_COLUMNS} FROM memories ORDER BY datetime_ms DESC, id DESC LIMIT 1"
+)
+_SQL_SELECT_MEMORIES = {
+    True: f"SELECT {_MEMORY_COLUMNS} FROM memories ORDER BY datetime_ms DESC, id DESC LIMIT ? OFFSET ?",
+    False: f"SELECT {_MEMORY_COLUMNS} FROM memories ORDER BY datetime_ms ASC, id ASC LIMIT ? OFFSET ?",
+}
+
+
+_ROLE_CACHE = {role.value: role for role in MessageRole}
+_MEMORY_KEYS = ("id", "type", "content", "user_id", "datetime")
+
+# Enum values as plain dict lookups, cheaper than Enum's value descriptor in batch loops
+_ROLE_VALUES = {role: role.value for role in MessageRole}
+_MEMORY_TYPE_VALUES = {memory_type: memory_type.value for memory_type in MemoryType}
+
+
+def _message_row(message: Message) -> tuple:
+    """Parameters for _SQL_INSERT_MESSAGE"""
+    return (
+        message.id,
+        _ROLE_VALUES[message.role],
+        message.content,
+        message.item_id,
+        message.user_id,
+        message.datetime,
+    )
+
+
+def _memory_row(memory: Memory) -> tuple:
+    """Parameters for _SQL_INSERT_MEMORY"""
+    return (_MEMORY_TYPE_VALUES[memory.type], memory.content, memory.user_id, memory.datetime)
+
+
+def _message_factory(cursor: sqlite3.Cursor, row: tuple) -> Message:
+    """Row factory building a Message, skipping validation of data we wrote ourselves"""
+    return Message.construct(
+        id=row[0],
+        role=_ROLE_CACHE[row[1]],
+        content=row[2],
+        item_id=row[3],
+        user_id=row[4],
+        datetime=row[5],
+    )
+
+
+def _memory_factory(cursor: sqlite3.Cursor, row: tuple) -> Dict[str, Any]:
+    """Row factory building a memory dict"""
+    return dict(zip(_MEMORY_KEYS, row))
+
+
+def _insert_rows(
+    conn: sqlite3.Connection, sql_for_count: Callable[[int], str], rows: Iterable[tuple], size: int
+) -> None:
+    """Insert rows size at a time, binding each chunk to one multi-row statement"""
+    for chunk in _chunked(rows, size):
+        conn.execute(sql_for_count(len(chunk)), tuple(chain.from_iterable(chunk)))
+
+
+def _chunked(rows: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    """Split rows into lists of at most size items"""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class _WriteQueue:
+    """
+    Buffer of (sql, params) writes that a background thread commits in batches.
+
+    Writes only leave the buffer through write(), which is called with the owner's
+    connection lock held. Whoever holds that lock can therefore flush first and is
+    guaranteed to observe every earlier enqueue.
+    """
+
+    def __init__(
+        self,
+        lock: threading.RLock,
+        connection: Callable[[], Optional[sqlite3.Connection]],
+        batch_size: int,
+        interval: float,
+    ):
+        """
+        Args:
+            lock: The lock guarding the connection
+            connection: Returns the open connection, or None once it has been closed
+            batch_size: Number of buffered writes that wakes the thread early
+            interval: Longest a buffered write waits before being committed, in seconds
+        """
+        self._lock = lock
+        self._connection = connection
+        self._batch_size = batch_size
+        self._interval = interval
+        self._pending: List[tuple] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+    def enqueue(self, sql: str, params: tuple) -> None:
+        """Buffer a single write"""
+        self.enqueue_many(sql, (params,))
+
+    def enqueue_many(self, sql: str, rows: Iterable[tuple]) -> None:
+        """Buffer one write per parameter tuple"""
+        with self._cond:
+            self._pending.extend((sql, params) for params in rows)
+            if len(self._pending) >= self._batch_size:
+                self._cond.notify()
+
+    def write(self, conn: sqlite3.Connection) -> None:
+        """Commit buffered writes in one transaction, must be called with the lock held"""
+        if not self._pending:
+            return
+        with self._cond:
+            pending, self._pending = self._pending, []
+        try:
+            with conn:
+                # Consecutive rows for the same statement go through one executemany()
+                for sql, group in groupby(pending, key=operator.itemgetter(0)):
+                    conn.executemany(sql, [params for _, params in group])
+        except Exception as e:
+            logger.error("Failed to write %d buffered rows: %s", len(pending), e)
+
+    def start(self) -> None:
+        """Start the background writer thread"""
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="ticos-storage-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the writer thread after it commits what is buffered"""
+        if not self._thread:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or len(self._pending) >= self._batch_size,
+                    timeout=self._interval,
+                )
+                stopping = self._stopping
+            with self._lock:
+                conn = self._connection()
+                if conn:
+                    self.write(conn)
+            if stopping:
+                return
+
+
+class _ReadConnectionHolder:
+    """A thread's read-only connection, kept in thread-local storage"""
+
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+
+def _close_read_connection(
+    lock: threading.RLock, read_conns: set, conn: sqlite3.Connection
+) -> None:
+    """Close a read connection whose thread has exited, unless close() already did"""
+    with lock:
+        if conn not in read_conns:
+            return
+        read_conns.discard(conn)
+    try:
+        conn.close()
+    except Exception as e:
+        logger.debug("Failed to close read connection: %s", e)
+
+
+class StorageService(Protocol):
     """Interface defining storage operations for messages and memories."""
 
-    @abstractmethod
     def set_store_root_dir(self, tf_root_dir: str, db_filename: Optional[str] = None) -> None:
         """
         Set the root directory for storage and optionally specify a database filename.
@@ -27,54 +453,98 @@ class StorageService(ABC):
         """
         pass
 
-    @abstractmethod
     def initialize(self) -> None:
         """Initialize the storage service."""
         pass
 
-    @abstractmethod
     def save_message(self, message: Message) -> bool:
         """Save a message to storage."""
         pass
 
-    @abstractmethod
+    def save_messages(self, messages: Iterable[Message]) -> bool:
+        """Save several messages to storage."""
+        return all([self.save_message(message) for message in messages])
+
     def get_message(self, message_id: str) -> Optional[Message]:
         """Get a message from storage."""
         pass
 
-    @abstractmethod
     def update_message(self, message_id: str, message: Message) -> bool:
         """Update a message in storage."""
         pass
 
-    @abstractmethod
+    def update_message_content_by_item_id(self, item_id: str, content: str) -> bool:
+        """
+        Replace the content of the message with the given item_id, the way
+        update_message() does.
+        """
+        message = self.get_message_by_item_id(item_id)
+        if message is None:
+            return False
+        message.content = content
+        return self.update_message(message.id, message)
+
     def delete_message(self, message_id: str) -> bool:
         """Delete a message from storage."""
         pass
 
-    @abstractmethod
     def get_messages(
-        self, offset: int = 0, limit: int = 100, desc: bool = True
+        self,
+        offset: int = 0,
+        limit: int = 100,
+        desc: bool = True,
+        with_content: bool = True,
+        role: Optional[MessageRole] = None,
+        since: Optional[str] = None,
     ) -> List[Message]:
-        """Get a list of messages from storage."""
+        """Get a list of messages from storage, optionally filtered by role and start datetime."""
         pass
 
-    @abstractmethod
+    def iter_messages(
+        self, offset: int = 0, limit: int = -1, desc: bool = True, page_size: int = 500
+    ) -> Iterator[Message]:
+        """
+        Yield messages one page at a time instead of materializing them all.
+
+        Args:
+            offset: Number of messages to skip
+            limit: Maximum number of messages to yield, -1 for no limit
+            desc: Newest first when True
+            page_size: Number of messages fetched per underlying get_messages() call
+        """
+        while limit:
+            count = page_size if limit < 0 else min(page_size, limit)
+            page = self.get_messages(offset, count, desc)
+            yield from page
+            if len(page) < count:
+                return
+            offset += count
+            if limit > 0:
+                limit -= count
+
     def get_message_by_item_id(self, item_id: str) -> Optional[Message]:
         """Get a message by its item_id."""
         pass
 
-    @abstractmethod
+    def get_max_message_id(self) -> Optional[int]:
+        """
+        Get the highest numeric message ID, or None if there is none or the storage
+        can't tell cheaply; TicosClient then starts its IDs from the clock.
+        """
+        return None
+
     def save_memory(self, memory: Memory) -> bool:
         """Save a memory to storage."""
         pass
 
-    @abstractmethod
+    def save_memories(self, memories: Iterable[Memory]) -> bool:
+        """Save several memories to storage."""
+        return all([self.save_memory(memory) for memory in memories])
+
     def get_memory(self, memory_id: str) -> Optional[Memory]:
         """Get a memory from storage."""
         pass
 
-    @abstractmethod
     def delete_memory(self, memory_id: str) -> bool:
         """Delete a memory from storage."""
         pass
@@ -83,13 +553,48 @@ class StorageService(ABC):
         """Get the most recent memory"""
         raise NotImplementedError
 
+    def get_context_bundle(
+        self, limit: int
+    ) -> Tuple[List[Message], Optional[Dict[str, Any]]]:
+        """
+        Get the latest messages and the most recent memory together.
+
+        Args:
+            limit: Maximum number of messages to return
+
+        Returns:
+            The messages, newest first, and the latest memory or None
+        """
+        return self.get_messages(0, limit, True), self.get_latest_memory()
+
     def get_memories(
         self, offset: int = 0, limit: int = 10, desc: bool = True
     ) -> List[Dict[str, Any]]:
         """Get memories with pagination"""
         raise NotImplementedError
 
-    @abstractmethod
+    def iter_memories(
+        self, offset: int = 0, limit: int = -1, desc: bool = True, page_size: int = 500
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield memories one page at a time instead of materializing them all.
+
+        Args:
+            offset: Number of memories to skip
+            limit: Maximum number of memories to yield, -1 for no limit
+            desc: Newest first when True
+            page_size: Number of memories fetched per underlying get_memories() call
+        """
+        while limit:
+            count = page_size if limit < 0 else min(page_size, limit)
+            page = self.get_memories(offset, count, desc)
+            yield from page
+            if len(page) < count:
+                return
+            offset += count
+            if limit > 0:
+                limit -= count
+
     def close(self) -> None:
         """Close the storage service and release resources."""
         pass
@@ -99,16 +604,77 @@ class SQLiteStorageService(StorageService):
     """SQLite implementation of StorageService"""
 
     # Current database schema version
-    CURRENT_DB_VERSION = 1
+    CURRENT_DB_VERSION = 7
+
+    # Buffered rows that wake the write-behind thread before its interval expires
+    WRITE_BEHIND_BATCH_SIZE = 500
 
-    def __init__(self):
+    # Longest a buffered row waits before the write-behind thread commits it, in seconds
+    WRITE_BEHIND_INTERVAL = 0.05
+
+    def __init__(
+        self,
+        write_behind: bool = False,
+        journal_mode: Optional[str] = None,
+        synchronous: Optional[str] = None,
+        durability: Optional[Durability] = None,
+    ):
         """
         Initialize SQLiteStorageService.
+
+        Args:
+            write_behind: If True, saves only buffer their rows and return immediately;
+                          a background thread commits the buffer in batched transactions.
+                          Any other use of the connection flushes the buffer first, so
+                          reads always see earlier saves.
+            journal_mode: SQLite journal mode overriding the durability tier's,
+                          ignored for in-memory databases
+            synchronous: SQLite synchronous level overriding the durability tier's
+            durability: Crash-safety tier selecting the journal mode and synchronous level.
+                        With RELAXED or NONE a database that turns out to be corrupt
+                        when initializing is deleted and recreated. Defaults to the
+                        TICOS_STORAGE_DURABILITY environment variable, or NORMAL.
         """
+        if durability is None:
+            durability = _default_durability()
+        default_journal_mode, default_synchronous = _DURABILITY_PRAGMAS[durability]
+        journal_mode = (journal_mode or default_journal_mode).upper()
+        synchronous = (synchronous or default_synchronous).upper()
+        if journal_mode not in _JOURNAL_MODES:
+            raise ValueError(f"Unsupported journal_mode: {journal_mode}")
+        if synchronous not in _SYNCHRONOUS_MODES:
+            raise ValueError(f"Unsupported synchronous: {synchronous}")
+        self.durability = durability
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
         self.db_path = None
         self.store_root_dir = None
         self.db_filename = None
+        # The single write connection, long-lived and shared across threads
         self.conn = None
+        # Swapped for real getters by initialize() and back by close(), so CRUD
+        # calls don't need to check whether the service is open
+        self._get_connection = self._raise_not_initialized
+        self._get_read_connection = self._raise_not_initialized
+        # Serializes use of the write connection
+        self._lock = threading.RLock()
+        # Reads run on a read-only connection per thread and only need the lock
+        # when they have to share the write connection (in-memory databases)
+        self._read_guard = nullcontext()
+        self._readers = threading.local()
+        # Every open read connection, closed by close() or when its thread exits
+        self._read_conns = set()
+        self.write_behind = write_behind
+        self._write_queue = (
+            _WriteQueue(
+                self._lock,
+                lambda: self.conn,
+                self.WRITE_BEHIND_BATCH_SIZE,
+                self.WRITE_BEHIND_INTERVAL,
+            )
+            if write_behind
+            else None
+        )
 
     def set_store_root_dir(self, tf_root_dir: str, db_filename: Optional[str] = None) -> None:
         """
@@ -122,6 +688,7 @@ class SQLiteStorageService(StorageService):
         """
         self.store_root_dir = tf_root_dir
         self.db_filename = db_filename
+        self.db_path = None
 
     def initialize(self) -> None:
         """Initialize the storage service."""
@@ -130,235 +697,349 @@ class SQLiteStorageService(StorageService):
             return
 
         try:
-            # Create config directory if it doesn't exist
-            if self.store_root_dir:
-                config_dir = Path(self.store_root_dir) / ".config" / "ticos"
-            else:
-                config_dir = Path.home() / ".config" / "ticos"
+            self._open()
+        except _sqlite.DatabaseError as e:
+            # Only the exact DatabaseError signals a corrupt or non-database file,
+            # its subclasses cover locking, permission and constraint failures
+            if (
+                type(e) is not _sqlite.DatabaseError
+                or self.durability not in _RECREATE_ON_CORRUPTION
+                or self.db_path == ":memory:"
+            ):
+                raise
+            logger.warning("Database at %s is unreadable (%s), recreating it", self.db_path, e)
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.unlink(self.db_path + suffix)
+                except FileNotFoundError:
+                    pass
+            self._open()
 
-            config_dir.mkdir(parents=True, exist_ok=True)
+    def _open(self) -> None:
+        """Connect to the database and bring its schema up to date"""
+        try:
+            # Re-initializing after close() reuses the resolved path without touching the filesystem
+            if not (self.db_path and os.path.exists(self.db_path)):
+                self.db_path = self._resolve_db_path()
 
-            # Set database path based on db_filename parameter
-            if self.db_filename:
-                if os.path.isabs(self.db_filename):
-                    # If db_filename is an absolute path, use it directly
-                    self.db_path = self.db_filename
-                else:
-                    # If db_filename is a relative path, make it relative to config_dir
-                    self.db_path = str(config_dir / self.db_filename)
-                # Ensure parent directory exists
-                Path(os.path.dirname(self.db_path)).mkdir(parents=True, exist_ok=True)
-            else:
-                # Use default database path
-                self.db_path = str(config_dir / "ticos.db")
-                
-            logger.info(f"Using database at: {self.db_path}")
+            logger.info("Using database at: %s", self.db_path)
             db_exists = Path(self.db_path).exists()
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            
+            self.conn = _sqlite.connect(
+                self.db_path, check_same_thread=False, cached_statements=256
+            )
+            if not db_exists:
+                # Must precede journal_mode=WAL, which fixes the page size of an empty database
+                self.conn.execute(_SQL_NEW_DATABASE_PAGE_SIZE)
+            self._apply_pragmas(self.conn)
+
             # Initialize database tables
             with self.conn as conn:
-                cursor = conn.cursor()
-                
-                # Create version table if it doesn't exist
-                cursor.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS db_version (
-                        id INTEGER PRIMARY KEY,
-                        version INTEGER NOT NULL,
-                        updated_at TEXT NOT NULL
-                    )
-                """
-                )
-                
-                # Check current database version
-                cursor.execute("SELECT version FROM db_version ORDER BY id DESC LIMIT 1")
-                row = cursor.fetchone()
-                current_version = row[0] if row else 0
-                
-                # If database is new or no version info, create latest schema directly
+                # If database is new, create latest schema directly
                 if not db_exists:
-                    logger.info(f"Creating new database with latest schema (version {self.CURRENT_DB_VERSION})")
+                    logger.info("Creating new database with latest schema (version %s)", self.CURRENT_DB_VERSION)
                     self._create_latest_schema(conn)
-                    
-                    # Insert version record
-                    cursor.execute(
-                        """
-                        INSERT INTO db_version (version, updated_at)
-                        VALUES (?, ?)
-                        """,
-                        (self.CURRENT_DB_VERSION, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-                    )
-                # If database exists but needs upgrading, apply incremental migrations
-                elif current_version < self.CURRENT_DB_VERSION:
-                    logger.info(f"Upgrading database from version {current_version} to {self.CURRENT_DB_VERSION}")
-                    self._migrate_database(conn, current_version)
-                    
-                    # Update database version
-                    cursor.execute(
-                        """
-                        INSERT INTO db_version (version, updated_at)
-                        VALUES (?, ?)
-                        """,
-                        (self.CURRENT_DB_VERSION, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-                    )
-                    
-                logger.info(f"Storage initialized successfully (DB version: {self.CURRENT_DB_VERSION})")
+                else:
+                    # Create version table if it doesn't exist
+                    conn.execute(_SQL_CREATE_VERSION_TABLE)
+
+                    # Check current database version
+                    row = conn.execute(_SQL_SELECT_DB_VERSION).fetchone()
+                    current_version = row[0] if row else 0
+
+                    # If database exists but needs upgrading, apply incremental migrations
+                    if current_version < self.CURRENT_DB_VERSION:
+                        logger.info(
+                            "Upgrading database from version %s to %s", current_version, self.CURRENT_DB_VERSION
+                        )
+                        self._migrate_database(conn, current_version)
+
+                        # Update database version
+                        conn.execute(
+                            _SQL_INSERT_DB_VERSION,
+                            (self.CURRENT_DB_VERSION, now_str()),
+                        )
+
+                logger.info("Storage initialized successfully (DB version: %s)", self.CURRENT_DB_VERSION)
+
+            if self._write_queue is not None:
+                self._get_connection = self._flushing_connection
+                self._get_read_connection = self._flushing_read_connection
+                self._write_queue.start()
+            else:
+                self._get_connection = self._open_connection
+                self._get_read_connection = self._thread_read_connection
+            # An in-memory database only exists on its own connection
+            if self.db_path == ":memory:":
+                self._get_read_connection = self._get_connection
+                self._read_guard = self._lock
         except Exception as e:
-            logger.error(f"Failed to initialize storage: {e}")
+            logger.error("Failed to initialize storage: %s", e)
             if self.conn:
                 self.conn.close()
                 self.conn = None
             raise
 
+    def _resolve_db_path(self) -> str:
+        """Build the database path from the store root and filename, creating its directory"""
+        if self.db_filename == ":memory:":
+            return self.db_filename
+
+        # Create config directory if it doesn't exist
+        if self.store_root_dir:
+            config_dir = Path(self.store_root_dir) / ".config" / "ticos"
+        else:
+            config_dir = Path.home() / ".config" / "ticos"
+
+        config_dir.mkdir(parents=True, exist_ok=True)
+
+        # Set database path based on db_filename parameter
+        if self.db_filename:
+            if os.path.isabs(self.db_filename):
+                # If db_filename is an absolute path, use it directly
+                db_path = self.db_filename
+            else:
+                # If db_filename is a relative path, make it relative to config_dir
+                db_path = str(config_dir / self.db_filename)
+            # Ensure parent directory exists
+            Path(os.path.dirname(db_path)).mkdir(parents=True, exist_ok=True)
+        else:
+            # Use default database path
+            db_path = str(config_dir / "ticos.db")
+
+        return db_path
+
+    def _apply_pragmas(self, conn):
+        """Apply journaling, durability and per-connection tuning pragmas"""
+        # In-memory databases cannot use WAL and have no journal file to tune
+        if self.db_path != ":memory:":
+            conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        for pragma in _CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+
     def _create_latest_schema(self, conn):
         """Create the latest database schema from scratch"""
-        cursor = conn.cursor()
-        
-        # Create messages table with the latest schema
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS messages (
-                id TEXT PRIMARY KEY,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                item_id TEXT,
-                user_id TEXT DEFAULT 'nobody',
-                datetime TEXT NOT NULL
-            )
-            """
+        # executescript() runs the whole DDL batch in one transaction, so a
+        # fresh database pays for a single commit on first start
+        conn.executescript(
+            "BEGIN;"
+            f"{_SQL_CREATE_VERSION_TABLE};"
+            f"{_SQL_CREATE_TABLES}"
+            + "".join(f"{statement};" for statement in _INDEX_DDL)
+            + "INSERT INTO db_version (version, updated_at) "
+            f"VALUES ({self.CURRENT_DB_VERSION}, datetime('now', 'localtime'));"
+            "COMMIT;"
         )
-        logger.debug("Created messages table with latest schema")
-        
-        # Create memories table with the latest schema
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS memories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                type TEXT NOT NULL,
-                content TEXT NOT NULL,
-                user_id TEXT DEFAULT 'nobody',
-                datetime TEXT NOT NULL
-            )
-            """
-        )
-        logger.debug("Created memories table with latest schema")
-        
-        conn.commit()
-    
+        logger.debug("Created tables and indexes with latest schema")
+
+    def _create_indexes(self, conn):
+        """Create the lookup and ordering indexes used by the queries below"""
+        for statement in _INDEX_DDL:
+            conn.execute(statement)
+        logger.debug("Created message and memory indexes")
+
     def _migrate_database(self, conn, current_version):
         """Perform incremental database migrations based on current version"""
-        cursor = conn.cursor()
-        
         # Apply migrations sequentially
         # Migration from version 0 to 1 (add user_id field)
         if current_version < 1:
             logger.info("Migrating database from version 0 to 1")
             
             # Add user_id column to messages table
-            cursor.execute("PRAGMA table_info(messages)")
-            columns = [column[1] for column in cursor.fetchall()]
-            if "user_id" not in columns:
-                cursor.execute("ALTER TABLE messages ADD COLUMN user_id TEXT DEFAULT 'nobody'")
+            if self._add_column(conn, "messages", "user_id TEXT DEFAULT 'nobody'"):
                 logger.debug("Added user_id column to messages table")
             
             # Add user_id column to memories table
-            cursor.execute("PRAGMA table_info(memories)")
-            columns = [column[1] for column in cursor.fetchall()]
-            if "user_id" not in columns:
-                cursor.execute("ALTER TABLE memories ADD COLUMN user_id TEXT DEFAULT 'nobody'")
+            if self._add_column(conn, "memories", "user_id TEXT DEFAULT 'nobody'"):
                 logger.debug("Added user_id column to memories table")
             
             conn.commit()
             current_version = 1
         
+        # Migration from version 1 to 2 (add item_id and datetime indexes)
+        if current_version < 2:
+            logger.info("Migrating database from version 1 to 2")
+            # The indexes themselves are created once all migrations have run
+            current_version = 2
+
+        # Migration from version 2 to 3 (order messages by an integer datetime_ms)
+        if current_version < 3:
+            logger.info("Migrating database from version 2 to 3")
+            if self._add_column(conn, "messages", "datetime_ms INTEGER"):
+                logger.debug("Added datetime_ms column to messages table")
+            conn.execute(f"UPDATE messages SET datetime_ms = {_SQL_DATETIME_MS.format('datetime')}")
+            conn.execute("DROP INDEX IF EXISTS idx_messages_datetime")
+            conn.commit()
+            current_version = 3
+
+        # Migration from version 3 to 4 (datetime_ms index becomes covering)
+        if current_version < 4:
+            logger.info("Migrating database from version 3 to 4")
+            conn.execute("DROP INDEX IF EXISTS idx_messages_datetime_ms")
+            conn.commit()
+            current_version = 4
+
+        # Migration from version 4 to 5 (add role filter index)
+        if current_version < 5:
+            logger.info("Migrating database from version 4 to 5")
+            # The index itself is created once all migrations have run
+            current_version = 5
+
+        # Migration from version 5 to 6 (id tiebreak in the ordering indexes)
+        if current_version < 6:
+            logger.info("Migrating database from version 5 to 6")
+            # Recreated with their new columns once all migrations have run
+            conn.execute("DROP INDEX IF EXISTS idx_messages_datetime_ms_meta")
+            conn.execute("DROP INDEX IF EXISTS idx_messages_role_datetime_ms")
+            conn.execute("DROP INDEX IF EXISTS idx_memories_datetime")
+            conn.commit()
+            current_version = 6
+
+        # Migration from version 6 to 7 (order memories by an integer datetime_ms)
+        if current_version < 7:
+            logger.info("Migrating database from version 6 to 7")
+            if self._add_column(conn, "memories", "datetime_ms INTEGER"):
+                logger.debug("Added datetime_ms column to memories table")
+            conn.execute(f"UPDATE memories SET datetime_ms = {_SQL_DATETIME_MS.format('datetime')}")
+            conn.execute("DROP INDEX IF EXISTS idx_memories_datetime")
+            conn.commit()
+            current_version = 7
+
         # Future migrations can be added here
-        # Migration from version 1 to 2
-        # if current_version < 2:
-        #     logger.debug("Migrating database from version 1 to 2")
-        #     # Add migration code here
-        #     conn.commit()
-        #     current_version = 2
-        
-        # Migration from version 2 to 3
-        # if current_version < 3:
-        #     logger.debug("Migrating database from version 2 to 3")
+        # Migration from version 7 to 8
+        # if current_version < 8:
+        #     logger.debug("Migrating database from version 7 to 8")
         #     # Add migration code here
         #     conn.commit()
-        #     current_version = 3
+        #     current_version = 8
+
+        self._create_indexes(conn)
+        conn.commit()
     
-    def _get_connection(self):
-        """Get the existing database connection."""
-        if not self.conn:
-            raise RuntimeError(
-                "Storage service is not initialized or has been closed. "
-                "Please call initialize() before using."
-            )
+    def _add_column(self, conn, table: str, column_definition: str) -> bool:
+        """Add a column unless it already exists, returning whether it was added"""
+        try:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column_definition}")
+            return True
+        except _sqlite.OperationalError as e:
+            if "duplicate column" not in str(e):
+                raise
+            return False
+
+    def _raise_not_initialized(self):
+        """Connection getter used while the service is not open"""
+        raise RuntimeError(
+            "Storage service is not initialized or has been closed. "
+            "Please call initialize() before using."
+        )
+
+    def _open_connection(self):
+        """Connection getter used while the service is open"""
+        return self.conn
+
+    def _flushing_connection(self):
+        """Connection getter used while open with write-behind enabled"""
+        # Called with self._lock held, so buffered saves land before this caller's statement
+        self._write_queue.write(self.conn)
         return self.conn
 
+    def _thread_read_connection(self):
+        """Read connection getter returning this thread's read-only connection, opening it on first use"""
+        holder = getattr(self._readers, "holder", None)
+        conn = holder.conn if holder is not None else None
+        if conn is None:
+            # WAL lets these read alongside the writer without taking its lock;
+            # journal_mode and synchronous are properties of the writer
+            conn = _sqlite.connect(
+                Path(self.db_path).absolute().as_uri() + "?mode=ro",
+                uri=True,
+                check_same_thread=False,
+                cached_statements=256,
+            )
+            for pragma in _CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            # The holder lives in this thread's local storage, which is dropped when the
+            # thread exits; the connection is closed then instead of staying open until close()
+            holder = _ReadConnectionHolder(conn)
+            weakref.finalize(holder, _close_read_connection, self._lock, self._read_conns, conn)
+            self._readers.holder = holder
+            with self._lock:
+                self._read_conns.add(conn)
+        return conn
+
+    def _flushing_read_connection(self):
+        """Read connection getter used while open with write-behind enabled"""
+        self.flush()
+        return self._thread_read_connection()
+
+    def _read(self, sql: str, params: tuple = (), row_factory=None) -> sqlite3.Cursor:
+        """
+        Run a SELECT on a read connection, must be called with self._read_guard held.
+
+        Reads skip the connection's context manager, which only exists to commit or
+        roll back writes, so they never pay for a transaction they don't open. The
+        row_factory is set on the cursor, so fetched rows come back already converted.
+        """
+        cursor = self._get_read_connection().cursor()
+        cursor.row_factory = row_factory
+        return cursor.execute(sql, params)
+
+    def _enqueue(self, sql: str, rows: Iterable[tuple]) -> bool:
+        """Buffer rows for the write-behind thread"""
+        if not self.conn:
+            self._raise_not_initialized()
+        self._write_queue.enqueue_many(sql, rows)
+        return True
+
+    def flush(self) -> None:
+        """Commit any saves still buffered by write-behind"""
+        with self._lock:
+            if self.conn and self._write_queue is not None:
+                self._write_queue.write(self.conn)
+
     def save_message(self, message: Message) -> bool:
         """Save a message to storage"""
+        return self.save_messages([message])
+
+    def save_messages(self, messages: Iterable[Message], chunk_size: Optional[int] = None) -> bool:
+        """
+        Save several messages in a single transaction.
+
+        Args:
+            messages: The messages to save
+            chunk_size: Optional maximum rows bound to one multi-row INSERT,
+                        capped at and defaulting to _INSERT_BATCH_ROWS
+        """
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    INSERT OR REPLACE INTO messages (id, role, content, item_id, user_id, datetime)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        message.id,
-                        message.role.value,
-                        message.content,
-                        message.item_id,
-                        message.user_id,
-                        message.datetime,
-                    ),
-                )
-                conn.commit()
+            if self._write_queue is not None:
+                return self._enqueue(_SQL_INSERT_MESSAGE, map(_message_row, messages))
+            with self._lock, self._get_connection() as conn:
+                size = min(chunk_size or _INSERT_BATCH_ROWS, _INSERT_BATCH_ROWS)
+                _insert_rows(conn, _sql_insert_messages, map(_message_row, messages), size)
                 return True
         except Exception as e:
-            logger.error(f"Failed to save message: {e}")
+            logger.error("Failed to save messages: %s", e)
             return False
 
     def get_message(self, message_id: str) -> Optional[Message]:
         """Get a message by ID"""
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT id, role, content, item_id, user_id, datetime FROM messages WHERE id = ?",
-                    (message_id,),
-                )
-                row = cursor.fetchone()
-                if row:
-                    return Message(
-                        id=row[0],
-                        role=MessageRole(row[1]),
-                        content=row[2],
-                        item_id=row[3],
-                        user_id=row[4],
-                        datetime=row[5],
-                    )
-                return None
+            with self._read_guard:
+                cursor = self._read(_SQL_SELECT_MESSAGE_BY_ID, (message_id,), _message_factory)
+                return cursor.fetchone()
         except Exception as e:
-            logger.error(f"Failed to get message: {e}")
+            logger.error("Failed to get message: %s", e)
             return None
 
     def update_message(self, message_id: str, message: Message) -> bool:
         """Update an existing message"""
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                
+            with self._lock, self._get_connection() as conn:
                 # First, perform the update operation
-                cursor.execute(
-                    """
-                    UPDATE messages SET role = ?, content = ?, item_id = ?, user_id = ?, datetime = ?
-                    WHERE id = ?
-                    """,
+                cursor = conn.execute(
+                    _SQL_UPDATE_MESSAGE,
                     (
-                        message.role.value,
+                        _ROLE_VALUES[message.role],
                         message.content,
                         message.item_id,
                         message.user_id,
@@ -366,242 +1047,335 @@ class SQLiteStorageService(StorageService):
                         message_id,
                     ),
                 )
-                
-                # Helper function to normalize text for comparison
-                def normalize_for_comparison(text):
-                    # Remove common punctuation at the end of the text (both Chinese and English)
-                    if text and text[-1] in '。，,.?!？！':
-                        return text[:-1]
-                    return text
-                
-                # Check if this is a user message, if so we need to check for duplicates
+
+                updated = cursor.rowcount > 0
+
+                # An updated user message may extend the previous one, which is then redundant
                 if message.role == MessageRole.USER:
-                    # Find the previous message (with the largest ID smaller than current)
-                    cursor.execute(
-                        """
-                        SELECT id, role, content FROM messages 
-                        WHERE id < ? 
-                        ORDER BY id DESC LIMIT 1
-                        """,
-                        (message_id,)
+                    cursor = conn.execute(
+                        _SQL_DELETE_INCREMENTAL_PREVIOUS, (message_id, message.content)
                     )
-                    prev_row = cursor.fetchone()
-                    
-                    # If previous message exists and is also from user
-                    if prev_row and prev_row[1] == MessageRole.USER.value:
-                        prev_id, _, prev_content = prev_row
-                        
-                        # Normalize both messages for comparison
-                        normalized_current = normalize_for_comparison(message.content)
-                        normalized_prev = normalize_for_comparison(prev_content)
-                        
-                        # Check if normalized current message starts with normalized previous message
-                        # or if previous message starts with current (handles backspace cases)
-                        if (normalized_current.startswith(normalized_prev) or 
-                            normalized_prev.startswith(normalized_current)):
-                            
-                            # Only proceed if they're not identical after normalization
-                            if normalized_current != normalized_prev:
-                                logger.debug(f"Detected incremental user message in update. Removing previous message {prev_id}")
-                                logger.debug(f"Previous: '{prev_content}', Current: '{message.content}'")
-                                
-                                # Delete the previous message as it's now redundant
-                                cursor.execute("DELETE FROM messages WHERE id = ?", (prev_id,))
-                
-                conn.commit()
-                return cursor.rowcount > 0
+                    if cursor.rowcount > 0:
+                        logger.debug(
+                            "Detected incremental user message in update. Removed the message before %s",
+                            message_id,
+                        )
+
+                return updated
+        except Exception as e:
+            logger.error("Failed to update message: %s", e)
+            return False
+
+    def update_message_content_by_item_id(self, item_id: str, content: str) -> bool:
+        """
+        Replace the content of the message with the given item_id in one transaction,
+        removing an earlier user message it extends as update_message() does
+        """
+        try:
+            with self._lock, self._get_connection() as conn:
+                # Resolve the item_id to one row, so the update and the cleanup below
+                # both apply to the same message
+                row = conn.execute(_SQL_SELECT_MESSAGE_ID_ROLE_BY_ITEM_ID, (item_id,)).fetchone()
+                if row is None:
+                    return False
+                message_id, role = row
+                conn.execute(_SQL_UPDATE_MESSAGE_CONTENT, (content, message_id))
+
+                if role == _ROLE_VALUES[MessageRole.USER]:
+                    cursor = conn.execute(
+                        _SQL_DELETE_INCREMENTAL_PREVIOUS, (message_id, content)
+                    )
+                    if cursor.rowcount > 0:
+                        logger.debug(
+                            "Detected incremental user message in update. Removed the message before %s",
+                            message_id,
+                        )
+                return True
         except Exception as e:
-            logger.error(f"Failed to update message: {e}")
+            logger.error("Failed to update message content: %s", e)
             return False
 
     def delete_message(self, message_id: str) -> bool:
         """Delete a message by ID"""
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM messages WHERE id = ?", (message_id,))
-                conn.commit()
+            with self._lock, self._get_connection() as conn:
+                cursor = conn.execute(_SQL_DELETE_MESSAGE, (message_id,))
                 return cursor.rowcount > 0
         except Exception as e:
-            logger.error(f"Failed to delete message: {e}")
+            logger.error("Failed to delete message: %s", e)
             return False
 
     def get_messages(
-        self, offset: int = 0, limit: int = 10, desc: bool = True
+        self,
+        offset: int = 0,
+        limit: int = 10,
+        desc: bool = True,
+        with_content: bool = True,
+        role: Optional[MessageRole] = None,
+        since: Optional[str] = None,
     ) -> List[Message]:
-        """Get messages with pagination"""
+        """
+        Get messages with pagination
+
+        Args:
+            offset: Number of messages to skip
+            limit: Maximum number of messages to return
+            desc: Newest first when True
+            with_content: If False, content is left empty and the page is read from the index only
+            role: Only return messages with this role
+            since: Only return messages at or after this "%Y-%m-%d %H:%M:%S" datetime
+        """
+        queries = _SQL_SELECT_MESSAGES if with_content else _SQL_SELECT_MESSAGE_METAS
+        sql = queries[role is not None, since is not None, bool(desc)]
+        params = tuple(value for value in (role, since) if value is not None) + (limit, offset)
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                order = "DESC" if desc else "ASC"
-                cursor.execute(
-                    f"SELECT id, role, content, item_id, user_id, datetime FROM messages ORDER BY datetime {order} LIMIT ? OFFSET ?",
-                    (limit, offset),
+            with self._read_guard:
+                return self._read(sql, params, _message_factory).fetchall()
+        except Exception as e:
+            logger.error("Failed to get messages: %s", e)
+            return []
+
+    def get_messages_after(
+        self, cursor_token: Optional[Tuple[str, str]], limit: int = 10, desc: bool = True
+    ) -> List[Message]:
+        """
+        Get the page of messages following a previous page, seeking instead of skipping rows
+
+        Args:
+            cursor_token: (datetime, id) of the last message of the previous page,
+                          or None for the first page
+            limit: Maximum number of messages to return
+            desc: Newest first when True, must match the previous page
+        """
+        if cursor_token is None:
+            return self.get_messages(0, limit, desc)
+        try:
+            with self._read_guard:
+                cursor = self._read(
+                    _SQL_SELECT_MESSAGES_AFTER[bool(desc)], (*cursor_token, limit), _message_factory
                 )
-                return [
-                    Message(
-                        id=row[0],
-                        role=MessageRole(row[1]),
-                        content=row[2],
-                        item_id=row[3],
-                        user_id=row[4],
-                        datetime=row[5],
-                    )
-                    for row in cursor.fetchall()
-                ]
+                return cursor.fetchall()
         except Exception as e:
-            logger.error(f"Failed to get messages: {e}")
+            logger.error("Failed to get messages: %s", e)
             return []
 
+    def iter_messages(
+        self, offset: int = 0, limit: int = -1, desc: bool = True, page_size: int = 500
+    ) -> Iterator[Message]:
+        """
+        Yield messages one page at a time, seeking past each page rather than re-skipping offset rows.
+
+        Args:
+            offset: Number of messages to skip before the first page
+            limit: Maximum number of messages to yield, -1 for no limit
+            desc: Newest first when True
+            page_size: Number of messages read per query
+        """
+        cursor_token = None
+        while limit:
+            count = page_size if limit < 0 else min(page_size, limit)
+            if cursor_token is None:
+                page = self.get_messages(offset, count, desc)
+            else:
+                page = self.get_messages_after(cursor_token, count, desc)
+            yield from page
+            if len(page) < count:
+                return
+            cursor_token = (page[-1].datetime, page[-1].id)
+            if limit > 0:
+                limit -= count
+
     def get_message_by_item_id(self, item_id: str) -> Optional[Message]:
         """Get a message by its item_id"""
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT id, role, content, item_id, user_id, datetime FROM messages WHERE item_id = ?",
-                    (item_id,),
-                )
-                row = cursor.fetchone()
-                if row:
-                    return Message(
-                        id=row[0],
-                        role=MessageRole(row[1]),
-                        content=row[2],
-                        item_id=row[3],
-                        user_id=row[4],
-                        datetime=row[5],
-                    )
-                return None
+            with self._read_guard:
+                cursor = self._read(_SQL_SELECT_MESSAGE_BY_ITEM_ID, (item_id,), _message_factory)
+                return cursor.fetchone()
+        except Exception as e:
+            logger.error("Failed to get message by item_id: %s", e)
+            return None
+
+    def get_max_message_id(self) -> Optional[int]:
+        """Get the highest numeric message ID, or None if there is none"""
+        try:
+            with self._read_guard:
+                return self._read(_SQL_SELECT_MAX_MESSAGE_ID).fetchone()[0]
         except Exception as e:
-            logger.error(f"Failed to get message by item_id: {e}")
+            logger.error("Failed to get max message id: %s", e)
             return None
 
     def save_memory(self, memory: Memory) -> bool:
-        """Save a memory to storage"""
+        """
+        Save a memory to storage, setting memory.id to the id it was assigned.
+
+        With write-behind enabled the row is only buffered and memory.id is left unset.
+        """
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    INSERT INTO memories (type, content, user_id, datetime)
-                    VALUES (?, ?, ?, ?)
-                    """,
-                    (memory.type.value, memory.content, memory.user_id, memory.datetime),
-                )
-                conn.commit()
+            if self._write_queue is not None:
+                return self._enqueue(_SQL_INSERT_MEMORY, (_memory_row(memory),))
+            with self._lock, self._get_connection() as conn:
+                # lastrowid is the AUTOINCREMENT id, so callers don't need a
+                # follow-up get_latest_memory() to find the new row. Unlike
+                # INSERT ... RETURNING it also works before SQLite 3.35.
+                memory.id = conn.execute(_SQL_INSERT_MEMORY, _memory_row(memory)).lastrowid
                 return True
         except Exception as e:
-            logger.error(f"Failed to save memory: {e}")
+            logger.error("Failed to save memory: %s", e)
+            return False
+
+    def save_memories(self, memories: Iterable[Memory], chunk_size: Optional[int] = None) -> bool:
+        """
+        Save several memories in a single transaction.
+
+        Args:
+            memories: The memories to save
+            chunk_size: Optional maximum rows bound to one multi-row INSERT,
+                        capped at and defaulting to _INSERT_BATCH_ROWS
+        """
+        try:
+            if self._write_queue is not None:
+                return self._enqueue(_SQL_INSERT_MEMORY, map(_memory_row, memories))
+            with self._lock, self._get_connection() as conn:
+                size = min(chunk_size or _INSERT_BATCH_ROWS, _INSERT_BATCH_ROWS)
+                _insert_rows(conn, _sql_insert_memories, map(_memory_row, memories), size)
+                return True
+        except Exception as e:
+            logger.error("Failed to save memories: %s", e)
             return False
 
     def get_memory(self, memory_id: int) -> Optional[Dict[str, Any]]:
         """Get a memory by ID"""
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT id, type, content, user_id, datetime FROM memories WHERE id = ?",
-                    (memory_id,),
-                )
-                row = cursor.fetchone()
-                if row:
-                    return {
-                        "id": row[0],
-                        "type": row[1],
-                        "content": row[2],
-                        "user_id": row[3],
-                        "datetime": row[4],
-                    }
-                return None
+            with self._read_guard:
+                cursor = self._read(_SQL_SELECT_MEMORY_BY_ID, (memory_id,), _memory_factory)
+                return cursor.fetchone()
         except Exception as e:
-            logger.error(f"Failed to get memory: {e}")
+            logger.error("Failed to get memory: %s", e)
             return None
 
     def update_memory(self, memory_id: int, memory: Memory) -> bool:
         """Update an existing memory"""
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    UPDATE memories SET type = ?, content = ?, user_id = ?, datetime = ?
-                    WHERE id = ?
-                    """,
-                    (memory.type.value, memory.content, memory.user_id, memory.datetime, memory_id),
+            with self._lock, self._get_connection() as conn:
+                cursor = conn.execute(
+                    _SQL_UPDATE_MEMORY,
+                    (_MEMORY_TYPE_VALUES[memory.type], memory.content, memory.user_id, memory.datetime, memory_id),
                 )
-                conn.commit()
                 return cursor.rowcount > 0
         except Exception as e:
-            logger.error(f"Failed to update memory: {e}")
+            logger.error("Failed to update memory: %s", e)
             return False
 
     def delete_memory(self, memory_id: int) -> bool:
         """Delete a memory by ID"""
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM memories WHERE id = ?", (memory_id,))
-                conn.commit()
+            with self._lock, self._get_connection() as conn:
+                cursor = conn.execute(_SQL_DELETE_MEMORY, (memory_id,))
                 return cursor.rowcount > 0
         except Exception as e:
-            logger.error(f"Failed to delete memory: {e}")
+            logger.error("Failed to delete memory: %s", e)
             return False
 
     def get_latest_memory(self) -> Optional[Dict[str, Any]]:
         """Get the most recent memory"""
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT id, type, content, user_id, datetime FROM memories ORDER BY datetime DESC LIMIT 1"
-                )
-                row = cursor.fetchone()
-                if row:
-                    return {
-                        "id": row[0],
-                        "type": row[1],
-                        "content": row[2],
-                        "user_id": row[3],
-                        "datetime": row[4],
-                    }
-                return None
+            with self._read_guard:
+                cursor = self._read(_SQL_SELECT_LATEST_MEMORY, (), _memory_factory)
+                return cursor.fetchone()
         except Exception as e:
-            logger.error(f"Failed to get latest memory: {e}")
+            logger.error("Failed to get latest memory: %s", e)
             return None
 
+    def get_context_bundle(
+        self, limit: int
+    ) -> Tuple[List[Message], Optional[Dict[str, Any]]]:
+        """
+        Get the latest messages and the most recent memory from one read transaction,
+        so both come from the same snapshot and share a single connection lookup.
+
+        Args:
+            limit: Maximum number of messages to return
+
+        Returns:
+            The messages, newest first, and the latest memory or None
+        """
+        try:
+            with self._read_guard:
+                conn = self._get_read_connection()
+                began = not conn.in_transaction
+                if began:
+                    conn.execute("BEGIN")
+                try:
+                    cursor = conn.cursor()
+                    cursor.row_factory = _message_factory
+                    sql = _SQL_SELECT_MESSAGES[False, False, True]
+                    messages = cursor.execute(sql, (limit, 0)).fetchall()
+                    cursor.row_factory = _memory_factory
+                    latest_memory = cursor.execute(_SQL_SELECT_LATEST_MEMORY).fetchone()
+                finally:
+                    if began:
+                        conn.execute("COMMIT")
+                return messages, latest_memory
+        except Exception as e:
+            logger.error("Failed to get context bundle: %s", e)
+            return [], None
+
     def get_memories(
         self, offset: int = 0, limit: int = 10, desc: bool = True
     ) -> List[Dict[str, Any]]:
         """Get memories with pagination"""
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                order = "DESC" if desc else "ASC"
-                cursor.execute(
-                    f"SELECT id, type, content, user_id, datetime FROM memories ORDER BY datetime {order} LIMIT ? OFFSET ?",
-                    (limit, offset),
-                )
-                return [
-                    {
-                        "id": row[0],
-                        "type": row[1],
-                        "content": row[2],
-                        "user_id": row[3],
-                        "datetime": row[4],
-                    }
-                    for row in cursor.fetchall()
-                ]
+            with self._read_guard:
+                cursor = self._read(_SQL_SELECT_MEMORIES[bool(desc)], (limit, offset), _memory_factory)
+                return cursor.fetchall()
         except Exception as e:
-            logger.error(f"Failed to get memories: {e}")
+            logger.error("Failed to get memories: %s", e)
             return []
 
+    def iter_memories(
+        self, offset: int = 0, limit: int = -1, desc: bool = True, page_size: int = _FETCH_ROWS
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield memories from a single query, fetching page_size rows at a time.
+
+        Args:
+            offset: Number of memories to skip
+            limit: Maximum number of memories to yield, -1 for no limit
+            desc: Newest first when True
+            page_size: Number of rows per fetchmany() call
+        """
+        try:
+            with self._read_guard:
+                cursor = self._read(_SQL_SELECT_MEMORIES[bool(desc)], (limit, offset), _memory_factory)
+            while True:
+                # Released between batches so a suspended iterator never blocks writers
+                with self._read_guard:
+                    rows = cursor.fetchmany(page_size)
+                if not rows:
+                    return
+                yield from rows
+        except Exception as e:
+            logger.error("Failed to iterate memories: %s", e)
+
     def close(self) -> None:
         """Close the database connection."""
-        if self.conn:
-            try:
-                self.conn.close()
-                self.conn = None
-                logger.info("Database connection closed successfully.")
-            except Exception as e:
-                logger.error(f"Error closing database connection: {e}")
+        if self._write_queue is not None:
+            self._write_queue.stop()
+        with self._lock:
+            if self.conn:
+                try:
+                    self.flush()
+                    for conn in list(self._read_conns):
+                        conn.close()
+                    self._read_conns.clear()
+                    self._readers = threading.local()
+                    # Let SQLite refresh query planner statistics before closing
+                    self.conn.execute("PRAGMA optimize")
+                    self.conn.close()
+                    self.conn = None
+                    self._get_connection = self._raise_not_initialized
+                    self._get_read_connection = self._raise_not_initialized
+                    self._read_guard = nullcontext()
+                    logger.info("Database connection closed successfully.")
+                except Exception as e:
+                    logger.error("Error closing database connection: %s", e)
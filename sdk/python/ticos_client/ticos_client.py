@@ -1,10 +1,12 @@
 import asyncio
+import itertools
 import json
 import logging
 import threading
 import time
-from datetime import datetime
 import os
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from functools import cached_property
 from pathlib import Path
 from threading import Lock, Thread
 from typing import Callable, Dict, Any, Optional, List, Union
@@ -13,13 +15,27 @@ from .storage import StorageService, SQLiteStorageService
 from .models import Message, MessageRole, Memory, MemoryType
 from .enums import SaveMode
 from .config import ConfigService
-from .utils import find_tf_root_directory
+from .utils import (
+    DATETIME_FORMAT,
+    find_tf_root_directory,
+    json_dumps,
+    json_dumps_indented,
+    json_loads,
+    now_str,
+)
 from .http_util import HttpUtil
 from .websocket_client import TicosWebSocketClient
-import requests
 
 logger = logging.getLogger(__name__)
 
+# Shared read-only defaults for missing message fields, so lookups don't allocate
+_EMPTY_DICT: Dict[str, Any] = {}
+_EMPTY_TUPLE: tuple = ()
+
+# Function calls routed to the motion and emotion handlers
+_MOTION_FUNCTIONS = frozenset({"motion", "motion_and_emotion"})
+_EMOTION_FUNCTIONS = frozenset({"emotion", "motion_and_emotion"})
+
 from .ticos_client_interface import MessageCallbackInterface
 
 
@@ -30,6 +46,63 @@ class TicosClient(MessageCallbackInterface):
     along with message and memory storage capabilities.
     """
 
+    # Attributes read on the message handling path live in slots rather than the
+    # instance dict; __dict__ stays available for subclasses, extra attributes and
+    # the lazily created ws_client
+    __slots__ = (
+        "port",
+        "save_mode",
+        "tf_root_dir",
+        "server",
+        "server_thread",
+        "running",
+        "storage",
+        "message_handler",
+        "motion_handler",
+        "emotion_handler",
+        "function_call_handler",
+        "conversation_handler",
+        "message_counter",
+        "_message_ids",
+        "_storage_dispatch",
+        "_audio_transcript_cache",
+        "config_service",
+        "context_rounds",
+        "_client_memory_generation",
+        "_agent_id",
+        "date_format",
+        "_executor",
+        "_background_tasks",
+        "_session_config_cache",
+        "_session_config_stat",
+        "_session_config_path",
+        "_session_config_tmp",
+        "_session_messages_fingerprint",
+        "_memory_generation_lock",
+        "_memory_generation_in_flight",
+        "_memory_generation_finished",
+        "_last_memory_message",
+        "__dict__",
+        "__weakref__",
+    )
+
+    # Most background tasks (memory generation, memory updates) running at once
+    BACKGROUND_WORKERS = 2
+
+    # Tasks allowed to wait for or run on the pool; later ones are dropped with a warning
+    MAX_PENDING_BACKGROUND_TASKS = 8
+
+    # Seconds after one memory generation finishes before another may be scheduled
+    MEMORY_GENERATION_MIN_INTERVAL = 30.0
+
+    # Flush session_config and its directory to disk on every update. Off by default:
+    # the messages in it are rebuilt from storage, so losing the last update in a
+    # crash costs nothing, while each fsync can take milliseconds
+    FSYNC_SESSION_CONFIG = False
+
+    # Seconds start() waits for the server to report that it is listening
+    STARTUP_TIMEOUT = 4.5
+
     def __init__(
         self,
         port: int = 9999,
@@ -65,23 +138,83 @@ class TicosClient(MessageCallbackInterface):
         )
         self.conversation_handler: Optional[Callable[[str, str, str], None]] = None
         self.message_counter = 0  # Add message counter
-        self._last_message_id = 0  # Track the last used message ID
+        # Message IDs count up from the start time in seconds, keeping the format of
+        # earlier time-based IDs while never repeating within this process
+        self._message_ids = itertools.count(int(time.time()))
+
+        # Storage handling for each incoming message type, the return value tells
+        # whether a complete text message was saved
+        self._storage_dispatch: Dict[str, Callable[[Dict[str, Any]], bool]] = {
+            "conversation.item.created": self._on_conversation_item_created,
+            "conversation.item.input_audio_transcription.completed": self._on_transcript_completed,
+            "response.done": self._on_response_done,
+            "response.audio_transcript.delta": self._on_transcript_delta,
+            "conversation.created": self._on_conversation_created,
+        }
 
         # Cache for audio transcript delta messages
-        self._audio_transcript_cache = {"item_id": None, "message": None, "content": ""}
+        # Deltas are collected as parts and joined once when the message is saved
+        self._audio_transcript_cache = {"item_id": None, "message": None, "parts": []}
+
+        # (role, content) pairs last written to session_config, lets unchanged message
+        # lists skip the file entirely; cleared when config or memory changes
+        self._session_messages_fingerprint: Optional[tuple] = None
 
         # Initialize config service
         self.config_service = ConfigService(save_mode, self.tf_root_dir)
-        self.context_rounds = self.config_service.get_context_rounds()
-        self.date_format = "%Y-%m-%d %H:%M:%S"
+        self._load_config_values()
+        self.config_service.add_reload_listener(self._load_config_values)
+        self.date_format = DATETIME_FORMAT
 
         self.update_variables()
         # Initialize background task management
-        self._background_task_lock = threading.Lock()
-        self._background_tasks = []
-        
-        # Initialize WebSocket client
-        self.ws_client = TicosWebSocketClient(self.config_service)
+        # Background work runs on a small shared pool instead of a thread per task;
+        # pending futures map to their task name until a done callback removes them,
+        # so stop() can wait on them. Single dict operations are atomic, so no lock
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._background_tasks: Dict[Future, str] = {}
+
+        # Parsed session_config as last read or written, with the (mtime_ns, size) it
+        # had then; reparsed only when the file changes underneath us
+        self._session_config_cache: Optional[Dict[str, Any]] = None
+        self._session_config_stat: Optional[tuple] = None
+        # The session_config ConfigService loads at startup, and its temp file for updates
+        self._session_config_path = self.config_service.user_config_dir / "session_config"
+        self._session_config_tmp = self._session_config_path.with_suffix(".tmp")
+
+        # At most one memory generation runs at a time, spaced out by
+        # MEMORY_GENERATION_MIN_INTERVAL; the finish time is from time.monotonic()
+        self._memory_generation_lock = Lock()
+        self._memory_generation_in_flight = False
+        self._memory_generation_finished = float("-inf")
+        # (id, content) of the newest message covered by the last saved memory
+        self._last_memory_message: Optional[tuple] = None
+
+    @cached_property
+    def ws_client(self) -> TicosWebSocketClient:
+        """WebSocket client for realtime messages, created on first use"""
+        return TicosWebSocketClient(self.config_service)
+
+    def reload_config(self) -> None:
+        """
+        Reload config.toml, the session config and the server config, and refresh the
+        configuration values cached by the client.
+
+        Raises:
+            Exception: If the configuration can't be loaded, as on startup
+        """
+        # initialize() runs the reload listeners, _load_config_values among them
+        self.config_service.initialize()
+
+    def _load_config_values(self) -> None:
+        """Cache the configuration values read while handling messages"""
+        # A reload may have rewritten session_config, write messages again next time
+        self._session_messages_fingerprint = None
+        self.context_rounds = self.config_service.get_context_rounds()
+        self._client_memory_generation = (
+            self.config_service.get("model.enable_memory_generation") == "client"
+        )
+        self._agent_id = self.config_service.get_agent_id()
 
     def _generate_message_id(self) -> str:
         """
@@ -90,28 +223,26 @@ class TicosClient(MessageCallbackInterface):
         Returns:
             str: A string representation of the message ID
         """
-        current_id = int(time.time())
+        return str(next(self._message_ids))
 
-        # If current_id is less than or equal to the last used ID, increment the last ID
-        if current_id <= self._last_message_id:
-            self._last_message_id += 1
-        else:
-            self._last_message_id = current_id
-
-        return str(self._last_message_id)
+    def _seed_message_ids(self) -> None:
+        """
+        Continue message IDs after the highest stored one, in case an earlier run
+        saved messages faster than one per second and got ahead of the clock.
+        """
+        # Storages predating get_max_message_id() keep IDs based on the clock alone
+        get_max_message_id = getattr(self.storage, "get_max_message_id", None)
+        last_id = (get_max_message_id() if get_max_message_id else None) or 0
+        self._message_ids = itertools.count(max(next(self._message_ids), last_id + 1))
 
     def _save_cached_audio_transcript(self) -> None:
         """
         Save the cached audio transcript message to storage and reset the cache.
         """
-        if (
-            self._audio_transcript_cache["message"]
-            and self._audio_transcript_cache["content"]
-        ):
+        content = "".join(self._audio_transcript_cache["parts"])
+        if self._audio_transcript_cache["message"] and content:
             # Update the message content with accumulated delta
-            self._audio_transcript_cache["message"].content = (
-                self._audio_transcript_cache["content"]
-            )
+            self._audio_transcript_cache["message"].content = content
 
             # Save to storage
             self.storage.save_message(self._audio_transcript_cache["message"])
@@ -123,7 +254,7 @@ class TicosClient(MessageCallbackInterface):
             self._audio_transcript_cache = {
                 "item_id": None,
                 "message": None,
-                "content": "",
+                "parts": [],
             }
 
     def enable_local_storage(self, storage_service: Optional[StorageService] = None, db_filename: Optional[str] = None):
@@ -146,24 +277,26 @@ class TicosClient(MessageCallbackInterface):
         try:
             storage_service.initialize()
             self.storage = storage_service
+            self._seed_message_ids()
             logger.info(f"Local storage enabled: {storage_service.__class__.__name__}")
 
-            if self.config_service.get("model.enable_memory_generation") == "client":
+            if self._client_memory_generation:
                 # We need to update the context messages in client side
                 self.update_session_config_messages()
         except Exception as e:
             logger.error(f"Failed to initialize storage: {e}")
-            if hasattr(self, 'message_handler') and self.message_handler is not None:
-                try:
-                    self.message_handler({
-                        'code': 'DATABASE_ERROR',
-                        'message': 'Storage service error, maybe the database is broken',
-                        'type': 'health.status'
-                    })
-                except Exception as handler_error:
-                    logger.error(f"Error sending error message to handler: {handler_error}")
+            self._emit_health("DATABASE_ERROR", "Storage service error, maybe the database is broken")
             raise
 
+    def _emit_health(self, code: str, message: str) -> None:
+        """Report a health.status error to the message handler, if one is set"""
+        if self.message_handler is None:
+            return
+        try:
+            self.message_handler({"code": code, "message": message, "type": "health.status"})
+        except Exception as handler_error:
+            logger.error(f"Error sending health status to handler: {handler_error}")
+
     def set_message_handler(self, handler: Callable[[Dict[str, Any]], None]):
         """
         Set the message handler function.
@@ -237,56 +370,34 @@ class TicosClient(MessageCallbackInterface):
             self.server_thread = Thread(target=run_server_thread_target, daemon=True, name=f"TicosServerThread-{self.port}")
             self.server_thread.start()
 
-            # Try up to two rounds of waiting/checking for server startup, each with 1.5 seconds interval.
-            max_attempts = 3
-            for attempt in range(max_attempts):
-                if attempt > 0:
-                    logger.info(f"TicosClient: Server not ready after first attempt, waiting for another 1.5 seconds...")
-                    
-                time.sleep(1.5)
-
-                # Check 1: UnifiedServer detected a startup error and set startup_error_message.
-                if self.server.startup_error_message:
-                    logger.error(f"TicosClient: Server startup failed. Reported error: {self.server.startup_error_message}")
-                    self.running = False
-                    return False
-
-                # Check 2: Server thread died unexpectedly without setting startup_error_message.
-                if not self.server_thread.is_alive():
-                    error_msg = f"TicosClient: Server thread for port {self.port} terminated unexpectedly without a specific startup error message."
-                    logger.error(error_msg)
-                    if hasattr(self, 'message_handler') and self.message_handler:
-                        try:
-                            self.message_handler({
-                                'code': 'EXECUTER_ERROR',
-                                'message': error_msg,
-                                'type': 'health.status'
-                            })
-                        except Exception as handler_error:
-                            logger.error(f"Error sending unexpected termination message to handler: {handler_error}")
-                    self.running = False
-                    return False
-
-                # Check 3: Server thread is alive, now check uvicorn.Server's 'started' state.
+            # UnifiedServer signals readiness as soon as uvicorn has bound its socket,
+            # or once run() has given up and recorded why
+            if not self.server.ready.wait(timeout=self.STARTUP_TIMEOUT):
                 uvicorn_instance = self.server._server
-                if uvicorn_instance is not None and uvicorn_instance.started:
-                    logger.info(f"Ticos client listener confirmed started successfully on port {self.port}")
-                    self.running = True
-                    return True
-
-            # If after two rounds still not ready, treat as timeout/failure
-            status_info = "uvicorn instance not available" if uvicorn_instance is None else f"uvicorn.started is {uvicorn_instance.started}"
-            error_msg = f"TicosClient: Failed to confirm server startup on port {self.port} within the allocated time ({max_attempts * 1.5}s). ({status_info})"
+                status_info = "uvicorn instance not available" if uvicorn_instance is None else f"uvicorn.started is {uvicorn_instance.started}"
+                error_msg = f"TicosClient: Failed to confirm server startup on port {self.port} within the allocated time ({self.STARTUP_TIMEOUT}s). ({status_info})"
+                logger.error(error_msg)
+                self._emit_health("EXECUTER_ERROR", error_msg)
+                self.running = False
+                return False
+
+            # Check 1: UnifiedServer detected a startup error and set startup_error_message.
+            if self.server.startup_error_message:
+                logger.error(f"TicosClient: Server startup failed. Reported error: {self.server.startup_error_message}")
+                self.running = False
+                return False
+
+            # Check 2: uvicorn.Server reports that its startup sequence completed.
+            uvicorn_instance = self.server._server
+            if uvicorn_instance is not None and uvicorn_instance.started:
+                logger.info(f"Ticos client listener confirmed started successfully on port {self.port}")
+                self.running = True
+                return True
+
+            # Otherwise the server thread ended without a specific startup error message.
+            error_msg = f"TicosClient: Server thread for port {self.port} terminated unexpectedly without a specific startup error message."
             logger.error(error_msg)
-            if hasattr(self, 'message_handler') and self.message_handler:
-                try:
-                    self.message_handler({
-                        'code': 'EXECUTER_ERROR',
-                        'message': error_msg,
-                        'type': 'health.status'
-                    })
-                except Exception as handler_error:
-                    logger.error(f"Error sending 'failed to confirm startup' message to handler: {handler_error}")
+            self._emit_health("EXECUTER_ERROR", error_msg)
             self.running = False
             return False
 
@@ -294,39 +405,26 @@ class TicosClient(MessageCallbackInterface):
             # This catches errors in TicosClient.start() itself, before thread launch or during checks.
             logger.error(f"TicosClient: Exception during server start sequence for port {self.port}: {e}", exc_info=True)
             self.running = False
-            if hasattr(self, 'message_handler') and self.message_handler:
-                try:
-                    self.message_handler({
-                        'code': 'EXECUTER_ERROR',
-                        'message': f'TicosClient: Critical error during server initialization: {str(e)}',
-                        'type': 'health.status'
-                    })
-                except Exception as handler_error:
-                    logger.error(f"Error sending critical initialization error message to handler: {handler_error}")
+            self._emit_health(
+                "EXECUTER_ERROR", f"TicosClient: Critical error during server initialization: {str(e)}"
+            )
             return False
 
     def stop(self):
         """Stop the server and clean up resources."""
         try:
             if self.server:
-                # 设置标志，通知服务器应该退出
-                if hasattr(self.server, '_should_exit'):
-                    self.server._should_exit = True
-                
-                # 如果服务器有 uvicorn 实例，也设置其退出标志
-                if hasattr(self.server, '_server') and self.server._server:
-                    self.server._server.should_exit = True
-                    # 尝试调用 uvicorn 服务器的 shutdown 方法
+                # Close the WebSocket connections and flag uvicorn to exit on the server's own
+                # loop; serve() then runs uvicorn's shutdown sequence and returns
+                loop = self.server.loop
+                if loop is not None:
                     try:
-                        if hasattr(self.server._server, 'shutdown'):
-                            # Uvicorn 的 shutdown 方法是一个协程，需要在事件循环中运行
-                            import asyncio
-                            loop = asyncio.new_event_loop()
-                            asyncio.set_event_loop(loop)
-                            loop.run_until_complete(self.server._server.shutdown())
-                            loop.close()
+                        asyncio.run_coroutine_threadsafe(self.server.shutdown(), loop).result(timeout=5)
                     except Exception as e:
-                        logger.error(f"Error calling uvicorn shutdown: {e}")
+                        logger.error(f"Error calling server shutdown: {e}")
+                self.server._should_exit = True
+                if self.server._server:
+                    self.server._server.should_exit = True
 
             # Wait for server thread to finish - this allows the server's own event loop to handle shutdown
             if self.server_thread and self.server_thread.is_alive():
@@ -336,24 +434,27 @@ class TicosClient(MessageCallbackInterface):
                     # 在 Python 中无法强制终止线程，但可以记录警告
                     # 如果需要更强的终止，可以考虑使用 multiprocessing 而不是 threading
 
-            # Close WebSocket client if active
-            if hasattr(self, 'ws_client'):
+            # Close WebSocket client if it was ever created
+            if "ws_client" in self.__dict__:
                 self.ws_client.close()
 
             # Wait for any background tasks to complete, with a timeout
-            with self._background_task_lock:
-                tasks_to_wait_for = list(self._background_tasks)
-                self._background_tasks.clear()
+            tasks_to_wait_for = list(self._background_tasks.items())
+            self._background_tasks.clear()
 
             if tasks_to_wait_for:
                 logger.info(f"Waiting for {len(tasks_to_wait_for)} background tasks to complete...")
-                for task in tasks_to_wait_for:
-                    task.join(timeout=15)  # Wait for each task for up to 15 seconds
-                    if task.is_alive():
+                for future, task_name in tasks_to_wait_for:
+                    try:
+                        future.result(timeout=15)  # Wait for each task for up to 15 seconds
+                    except FuturesTimeoutError:
                         logger.warning(
-                            f"Background task '{task.name}' did not complete within the timeout."
+                            f"Background task '{task_name}' did not complete within the timeout."
                         )
                 logger.info("Finished waiting for background tasks.")
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
 
             # Clean up resources
             self.server = None
@@ -393,19 +494,12 @@ class TicosClient(MessageCallbackInterface):
 
             logger.debug(f"Sending message: {message}")
 
-            # Send message directly using WebSocket
-            if self.server and hasattr(self.server, "broadcast_message"):
-                try:
-                    # Create a new event loop for this operation
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-
-                    # Run the broadcast coroutine
-                    loop.run_until_complete(self.server.broadcast_message(message))
-                    loop.close()
-                except Exception as e:
-                    logger.warning(f"Error broadcasting message: {e}")
-            else:
+            # Queue the broadcast on the server's own event loop, which owns the WebSocket
+            # connections, and return without waiting for it to be sent. Encoding here
+            # keeps it off that loop, snapshots the message, and reports values that
+            # can't be encoded to the caller
+            server = self.server
+            if not (server and server.enqueue_broadcast(json_dumps(message))):
                 logger.debug("Server not available for broadcasting")
 
             return True
@@ -443,186 +537,60 @@ class TicosClient(MessageCallbackInterface):
             logger.warning(f"Invalid message format: {message}")
             return False
 
-        try:
-            # Save the message to local storage if enabled
-            if self.storage:
-                try:
-                    text_message = False
-                    # Process different message types
-                    msg_type = message.get("type")
-
-                    # Handle conversation.item.created - user message
-                    if msg_type == "conversation.item.created":
-                        item = message.get("item", {})
-                        if item.get("type") == "message" and item.get("role") == "user":
-                            # Check if content contains input_audio
-                            content_list = item.get("content", [])
-                            for content in content_list:
-                                if content.get("type") == "input_audio":
-                                    # Save as user message with empty content (will be updated later)
-                                    msg = Message(
-                                        id=self._generate_message_id(),
-                                        role=MessageRole.USER,
-                                        content="",  # Empty content, will be updated when transcription arrives
-                                        item_id=item.get(
-                                            "id"
-                                        ),  # Save the item_id for later reference
-                                        datetime=datetime.now().strftime(
-                                            self.date_format
-                                        ),
-                                    )
-                                    logger.debug(
-                                        f"Saving initial user message with item_id: {item.get('id')}"
-                                    )
-                                    self.storage.save_message(msg)
-
-                                    # Call conversation handler if available
-                                    if (
-                                        hasattr(self, "conversation_handler")
-                                        and self.conversation_handler
-                                    ):
-                                        self.conversation_handler(
-                                            item.get("id"), MessageRole.USER, ""
-                                        )
-                                    break
-
-                    # Handle conversation.item.input_audio_transcription.completed - update user message
-                    elif (
-                        msg_type
-                        == "conversation.item.input_audio_transcription.completed"
-                    ):
-                        item_id = message.get("item_id")
-                        transcript = message.get("transcript", "")
-
-                        if item_id:
-                            # Find the message with this item_id using the new method
-                            msg = self.storage.get_message_by_item_id(item_id)
-                            if msg:
-                                # Update the message with the transcript
-                                msg.content = transcript
-                                self.storage.update_message(msg.id, msg)
-                                logger.debug(
-                                    f"Updated user message with transcript for item_id: {item_id}"
-                                )
-
-                                # Call conversation handler if available
-                                if (
-                                    hasattr(self, "conversation_handler")
-                                    and self.conversation_handler
-                                ):
-                                    self.conversation_handler(
-                                        item_id, MessageRole.USER, transcript
-                                    )
-                            else:
-                                logger.warning(
-                                    f"No message found with item_id: {item_id} for transcript update"
-                                )
-
-                    # Handle response.done - assistant message
-                    elif msg_type == "response.done":
-                        # First, save any cached audio transcript message
-                        if (
-                            self._audio_transcript_cache["item_id"]
-                            and self._audio_transcript_cache["message"]
-                        ):
-                            self._save_cached_audio_transcript()
-                            text_message = True
-
-                    # Handle response.audio_transcript.delta - assistant message delta
-                    elif msg_type == "response.audio_transcript.delta":
-                        item_id = message.get("item_id")
-                        delta = message.get("delta", "")
-                        text_message = False
-
-                        # Process only non-empty deltas
-                        if delta and item_id:
-                            # Call conversation handler if available
-                            if (
-                                hasattr(self, "conversation_handler")
-                                and self.conversation_handler
-                            ):
-                                self.conversation_handler(
-                                    item_id, MessageRole.ASSISTANT, delta
-                                )
-
-                            # Check if we need to save the previous cached message
-                            if (
-                                self._audio_transcript_cache["item_id"]
-                                and self._audio_transcript_cache["item_id"] != item_id
-                            ):
-                                # Save previous cached message before starting a new one
-                                self._save_cached_audio_transcript()
-                                text_message = True
-
-                            # Create a new message if this is the first delta for this item_id
-                            if (
-                                not self._audio_transcript_cache["item_id"]
-                                or self._audio_transcript_cache["item_id"] != item_id
-                            ):
-                                # This is the first delta for this item_id
-                                self._audio_transcript_cache["item_id"] = item_id
-                                self._audio_transcript_cache["message"] = Message(
-                                    id=self._generate_message_id(),
-                                    role=MessageRole.ASSISTANT,
-                                    content="",  # Will be updated when saving
-                                    item_id=item_id,
-                                    datetime=datetime.now().strftime(self.date_format),
-                                )
-                                self._audio_transcript_cache["content"] = delta
-                            else:
-                                # Append to existing content
-                                self._audio_transcript_cache["content"] += delta
-
-                    # For other message types, don't store
-                    elif msg_type == "conversation.created":
-                        text_message = False
-            
-                        # Send initial memory update after conversation created
-                        self._run_in_background(
-                            self._send_memory_update,
-                            "initial_memory_update",
-                        )
-                        
-                    else:
-                        text_message = False
+        # Nothing to store and nobody to notify. The handlers are public attributes that
+        # may be assigned directly, so they are checked here rather than cached by the setters
+        if self.storage is None and not (
+            self.message_handler
+            or self.motion_handler
+            or self.emotion_handler
+            or self.function_call_handler
+            or self.conversation_handler
+        ):
+            return False
 
-                    # Check if we need to generate a memory
-                    if text_message and not msg_type == "conversation.item.created":
-                        # Only proceed if memory generation is enabled in config
+        # Save the message to local storage if enabled
+        if self.storage is not None:
+            try:
+                msg_type = message.get("type")
+                storage_handler = self._storage_dispatch.get(msg_type)
+                text_message = storage_handler(message) if storage_handler else False
+
+                # Check if we need to generate a memory
+                if text_message:
+                    # Only proceed if memory generation is enabled in config
+                    if self._client_memory_generation:
+                        self.message_counter += 1
+                        logger.debug(f"Message counter: {self.message_counter}")
+                        # Start memory generation and session update in background; if
+                        # one is running or just finished, keep counting and retry on
+                        # the next text message
                         if (
-                            self.config_service.get("model.enable_memory_generation")
-                            == "client"
+                            self.message_counter * 2 >= self.context_rounds
+                            and self._schedule_memory_generation()
                         ):
-                            self.message_counter += 1
-                            logger.debug(f"Message counter: {self.message_counter}")
-                            if self.message_counter * 2 >= self.context_rounds:
-                                self.message_counter = 0  # Reset counter
-                                # Start memory generation and session update in background
-                                self._run_in_background(
-                                    self._generate_memory_and_update_session,
-                                    "memory_generation",
-                                )
-                except Exception as e:
-                    logger.error(
-                        f"Failed to save message to storage: {e}", exc_info=True
-                    )
+                            self.message_counter = 0  # Reset counter
+            except Exception as e:
+                logger.error(
+                    f"Failed to save message to storage: {e}", exc_info=True
+                )
 
+        try:
             # Handle different function calls
             overall_handlers_called = False
 
             # Handle base message types with the message handler
-            if hasattr(self, "message_handler") and self.message_handler:
+            if self.message_handler is not None:
                 self.message_handler(message)
                 overall_handlers_called = True
 
             # Handle function call responses
             if message.get("type") == "response.output_item.done":
-                item = message.get("item", {})
+                item = message.get("item") or _EMPTY_DICT
                 if item.get("type") == "function_call":
                     function_name = item.get("name", "")
                     try:
                         # Try to parse arguments as JSON, fallback to empty dict if invalid
-                        args = json.loads(item.get("arguments", "{}"))
+                        args = json_loads(item.get("arguments") or "{}")
                     except json.JSONDecodeError:
                         args = {}
                         logger.warning(
@@ -631,28 +599,16 @@ class TicosClient(MessageCallbackInterface):
 
                     handlers_called = False
 
-                    if (
-                        function_name in ["motion", "motion_and_emotion"]
-                        and hasattr(self, "motion_handler")
-                        and self.motion_handler
-                    ):
+                    if function_name in _MOTION_FUNCTIONS and self.motion_handler:
                         self.motion_handler(args)
                         handlers_called = True
 
-                    if (
-                        function_name in ["emotion", "motion_and_emotion"]
-                        and hasattr(self, "emotion_handler")
-                        and self.emotion_handler
-                    ):
+                    if function_name in _EMOTION_FUNCTIONS and self.emotion_handler:
                         self.emotion_handler(args)
                         handlers_called = True
 
                     # Handle other function calls with the generic function call handler
-                    if (
-                        not handlers_called
-                        and hasattr(self, "function_call_handler")
-                        and self.function_call_handler
-                    ):
+                    if not handlers_called and self.function_call_handler:
                         self.function_call_handler(function_name, args)
                         handlers_called = True
 
@@ -665,6 +621,111 @@ class TicosClient(MessageCallbackInterface):
             logger.error(f"Error handling message: {e}")
             return False
 
+    def _on_conversation_item_created(self, message: Dict[str, Any]) -> bool:
+        """Save a new user audio message with empty content, to be filled in by its transcript"""
+        item = message.get("item") or _EMPTY_DICT
+        if item.get("type") == "message" and item.get("role") == "user":
+            # Check if content contains input_audio
+            content_list = item.get("content") or _EMPTY_TUPLE
+            for content in content_list:
+                if content.get("type") == "input_audio":
+                    # User message with empty content, filled in when transcription arrives
+                    msg = Message(
+                        id=self._generate_message_id(),
+                        role=MessageRole.USER,
+                        content="",  # Empty content, will be updated when transcription arrives
+                        item_id=item.get("id"),  # Save the item_id for later reference
+                        datetime=now_str(),
+                    )
+                    logger.debug(
+                        f"Saving initial user message with item_id: {item.get('id')}"
+                    )
+                    self.storage.save_message(msg)
+
+                    # Call conversation handler if available
+                    if self.conversation_handler:
+                        self.conversation_handler(item.get("id"), MessageRole.USER, "")
+                    break
+        return False
+
+    def _on_transcript_completed(self, message: Dict[str, Any]) -> bool:
+        """Update the user message created for an audio item with its transcript"""
+        item_id = message.get("item_id")
+        transcript = message.get("transcript", "")
+
+        if item_id:
+            # Fill in the message saved on conversation.item.created, found by item_id
+            if self.storage.update_message_content_by_item_id(item_id, transcript):
+                logger.debug(f"Updated user message with transcript for item_id: {item_id}")
+
+                # Call conversation handler if available
+                if self.conversation_handler:
+                    self.conversation_handler(item_id, MessageRole.USER, transcript)
+            else:
+                logger.warning(
+                    f"No message found with item_id: {item_id} for transcript update"
+                )
+        return False
+
+    def _on_response_done(self, message: Dict[str, Any]) -> bool:
+        """Save the assistant message accumulated from transcript deltas"""
+        if (
+            self._audio_transcript_cache["item_id"]
+            and self._audio_transcript_cache["message"]
+        ):
+            self._save_cached_audio_transcript()
+            return True
+        return False
+
+    def _on_transcript_delta(self, message: Dict[str, Any]) -> bool:
+        """Accumulate an assistant transcript delta, saving the previous item's message when the item changes"""
+        item_id = message.get("item_id")
+        delta = message.get("delta", "")
+        text_message = False
+
+        # Process only non-empty deltas
+        if delta and item_id:
+            # Call conversation handler if available
+            if self.conversation_handler:
+                self.conversation_handler(item_id, MessageRole.ASSISTANT, delta)
+
+            # Check if we need to save the previous cached message
+            if (
+                self._audio_transcript_cache["item_id"]
+                and self._audio_transcript_cache["item_id"] != item_id
+            ):
+                # Save previous cached message before starting a new one
+                self._save_cached_audio_transcript()
+                text_message = True
+
+            # Create a new message if this is the first delta for this item_id
+            if (
+                not self._audio_transcript_cache["item_id"]
+                or self._audio_transcript_cache["item_id"] != item_id
+            ):
+                # This is the first delta for this item_id
+                self._audio_transcript_cache["item_id"] = item_id
+                self._audio_transcript_cache["message"] = Message(
+                    id=self._generate_message_id(),
+                    role=MessageRole.ASSISTANT,
+                    content="",  # Will be updated when saving
+                    item_id=item_id,
+                    datetime=now_str(),
+                )
+                self._audio_transcript_cache["parts"] = [delta]
+            else:
+                # Append to existing content
+                self._audio_transcript_cache["parts"].append(delta)
+        return text_message
+
+    def _on_conversation_created(self, message: Dict[str, Any]) -> bool:
+        """Send the initial memory update once a conversation is created"""
+        self._run_in_background(
+            self._send_memory_update,
+            "initial_memory_update",
+        )
+        return False
+
     def generate_memory(self) -> bool:
         """
         Generate a memory from recent conversation history.
@@ -677,16 +738,39 @@ class TicosClient(MessageCallbackInterface):
             return False
 
         try:
-            # Get the latest messages
-            messages = self.storage.get_messages(0, self.context_rounds, True)
-
-            # Get the latest memory for context
-            latest_memory = self.storage.get_latest_memory()
+            # Get the latest messages and the latest memory for context
+            messages, latest_memory = self.storage.get_context_bundle(self.context_rounds)
+            messages.reverse()
             last_memory_content = latest_memory["content"] if latest_memory else ""
+        except Exception as e:
+            logger.error(f"Error generating memory: {e}", exc_info=True)
+            return False
+
+        return self._generate_memory_from(messages, last_memory_content) is not None
+
+    def _generate_memory_from(
+        self, messages: List[Message], last_memory_content: str
+    ) -> Optional[str]:
+        """
+        Generate and save a memory from already fetched messages.
+
+        Args:
+            messages: Latest messages, oldest first
+            last_memory_content: Content of the latest memory, or an empty string
 
+        Returns:
+            Optional[str]: Content of the new memory, or None if none was generated
+        """
+        # Nothing new to summarize since the last saved memory
+        newest = (messages[-1].id, messages[-1].content) if messages else None
+        if newest is None or newest == self._last_memory_message:
+            logger.debug("No new messages since the last memory, skipping generation")
+            return None
+
+        try:
             # Use HttpUtil to call the summarization API
             memory_content = HttpUtil.summarize_conversation(
-                reversed(messages), last_memory_content, self.config_service
+                messages, last_memory_content, self.config_service
             )
 
             if memory_content:
@@ -694,16 +778,44 @@ class TicosClient(MessageCallbackInterface):
                 memory = Memory(
                     type=MemoryType.LONG_TERM,
                     content=memory_content,
-                    datetime=datetime.now().strftime(self.date_format),
+                    datetime=now_str(),
                 )
                 if self.running:
                     # Avoid save on stop
-                    self.storage.save_memory(memory)
-                return True
-            return False
+                    if self.storage.save_memory(memory):
+                        self._last_memory_message = newest
+                    # Force one session_config write after the memory changed
+                    self._session_messages_fingerprint = None
+                return memory_content
+            return None
         except Exception as e:
             logger.error(f"Error generating memory: {e}", exc_info=True)
+            return None
+
+    def _schedule_memory_generation(self) -> bool:
+        """
+        Start memory generation in the background unless one is already running or
+        the last one finished less than MEMORY_GENERATION_MIN_INTERVAL seconds ago.
+
+        Returns:
+            bool: True if memory generation was scheduled, False otherwise
+        """
+        with self._memory_generation_lock:
+            if (
+                self._memory_generation_in_flight
+                or time.monotonic() - self._memory_generation_finished
+                < self.MEMORY_GENERATION_MIN_INTERVAL
+            ):
+                return False
+            self._memory_generation_in_flight = True
+
+        if self._run_in_background(
+            self._generate_memory_and_update_session, "memory_generation"
+        ) is None:
+            with self._memory_generation_lock:
+                self._memory_generation_in_flight = False
             return False
+        return True
 
     def _generate_memory_and_update_session(self):
         """
@@ -711,37 +823,73 @@ class TicosClient(MessageCallbackInterface):
         This method is designed to run in a background thread.
         """
         try:
-            # Update session config locally
-            self.update_session_config_messages()
+            self._run_memory_generation()
+        finally:
+            with self._memory_generation_lock:
+                self._memory_generation_finished = time.monotonic()
+                self._memory_generation_in_flight = False
+
+    def _run_memory_generation(self):
+        """Body of _generate_memory_and_update_session()"""
+        if not self.storage:
+            return
+
+        try:
+            # Read once for both the session config and the memory summary, and put
+            # the messages in conversation order once for both
+            messages, latest_memory = self.storage.get_context_bundle(self.context_rounds)
+            messages.reverse()
+            last_memory_content = latest_memory["content"] if latest_memory else ""
+
+            # Update session config locally while the summarization request is in
+            # flight, it doesn't depend on the summary; inline if the pool is full
+            session_update = self._run_in_background(
+                lambda: self._update_session_config_from(messages),
+                "session_config_update",
+            )
+            if session_update is None:
+                self._update_session_config_from(messages)
+
+            memory_content = self._generate_memory_from(messages, last_memory_content)
+            if session_update is not None:
+                # Wait, so this run's session_config write never overlaps the next one's
+                session_update.result()
 
             # Only send memory update if memory generation was successful
-            if self.generate_memory():
-                # Send memory update via WebSocket if memory exists and feature is enabled
-                self._send_memory_update()
+            if memory_content:
+                # Send the new memory via WebSocket if the feature is enabled
+                self._send_memory_update(memory_content)
         except Exception as e:
             logger.error(f"Error in background task: {e}", exc_info=True)
             
-    def _send_memory_update(self):
+    def _send_memory_update(self, memory_content: Optional[str] = None):
         """
-        Send initial memory update via WebSocket after client starts.
-        This is called once during startup to ensure the server has the latest memory.
+        Send a memory update via WebSocket.
+        Called once during startup to ensure the server has the latest memory, and
+        after each memory generation with the content just generated.
+
+        Args:
+            memory_content: Memory to send, read from storage when None
         """
         try:
             # Only proceed if memory generation is enabled on client
-            if self.config_service.get("model.enable_memory_generation") != "client":
+            if not self._client_memory_generation:
                 logger.debug("Memory generation not enabled on client, skipping initial update")
                 return
                 
             # Get agent ID
-            agent_id = self.config_service.get_agent_id()
+            agent_id = self._agent_id
             if not agent_id:
                 logger.warning("Cannot send memory update: No agent_id configured")
                 return
                 
             # Get the latest memory
-            latest_memory = self.storage.get_latest_memory()
-            last_memory_content = latest_memory["content"] if latest_memory else ""
-            
+            if memory_content is not None:
+                last_memory_content = memory_content
+            else:
+                latest_memory = self.storage.get_latest_memory()
+                last_memory_content = latest_memory["content"] if latest_memory else ""
+
             # Append extended_properties.memory from session config if exists
             try:
                 extended_memory = self.config_service.get("extended_properties.memory", "")
@@ -755,25 +903,35 @@ class TicosClient(MessageCallbackInterface):
             except Exception as e:
                 logger.warning(f"Failed to append extended memory: {e}")
             
-            # Send memory update via WebSocket if memory exists
+            # Send memory update via WebSocket if memory exists, without holding up
+            # the caller for the connection round trips
             if last_memory_content:
-                success = self.ws_client.send_user_prompt_update(agent_id, last_memory_content)
-                if success:
-                    logger.debug("Memory update sent successfully via WebSocket")
-                else:
-                    logger.error("Failed to send memory update via WebSocket")
+                self._run_in_background(
+                    lambda: self._deliver_memory_update(agent_id, last_memory_content),
+                    "memory_update_send",
+                )
             else:
                 logger.warning("No memory available for initial update")
         except Exception as e:
             logger.error(f"Error sending initial memory update: {e}", exc_info=True)
 
-    def _run_in_background(self, func, task_name):
+    def _deliver_memory_update(self, agent_id: str, memory_content: str) -> None:
+        """Send a prepared memory update over the WebSocket client and log the outcome"""
+        if self.ws_client.send_user_prompt_update(agent_id, memory_content):
+            logger.debug("Memory update sent successfully via WebSocket")
+        else:
+            logger.error("Failed to send memory update via WebSocket")
+
+    def _run_in_background(self, func, task_name) -> Optional[Future]:
         """
-        Run a function in a background thread.
+        Run a function on the background thread pool.
 
         Args:
             func: The function to run
             task_name: Name of the task for logging
+
+        Returns:
+            Optional[Future]: The scheduled task, or None if it was dropped
         """
 
         def task_wrapper():
@@ -785,21 +943,24 @@ class TicosClient(MessageCallbackInterface):
                 logger.error(
                     f"Error in background task {task_name}: {e}", exc_info=True
                 )
-            finally:
-                with self._background_task_lock:
-                    self._background_tasks = [
-                        t for t in self._background_tasks if t.is_alive()
-                    ]
 
-        thread = Thread(
-            target=task_wrapper, daemon=True, name=f"TicosClient_{task_name}"
-        )
-        thread.start()
+        tasks = self._background_tasks
+        if len(tasks) >= self.MAX_PENDING_BACKGROUND_TASKS:
+            logger.warning(
+                f"Dropping background task {task_name}: "
+                f"{len(tasks)} background tasks already pending"
+            )
+            return None
 
-        with self._background_task_lock:
-            # Clean up finished tasks
-            self._background_tasks = [t for t in self._background_tasks if t.is_alive()]
-            self._background_tasks.append(thread)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.BACKGROUND_WORKERS, thread_name_prefix="TicosClient"
+            )
+        future = self._executor.submit(task_wrapper)
+        tasks[future] = task_name
+        # Runs at once if the task already finished, so nothing is left behind
+        future.add_done_callback(lambda done: tasks.pop(done, None))
+        return future
 
     def update_session_config_messages(self):
         """
@@ -813,43 +974,52 @@ class TicosClient(MessageCallbackInterface):
             return
 
         try:
-
             # Get the latest messages
             messages = self.storage.get_messages(0, self.context_rounds, True)
+            messages.reverse()
+        except Exception as e:
+            logger.error(f"Error updating session_config messages: {e}")
+            return
 
-            # Prepare message list for session_config
-            session_messages = []
-
-            # Add conversation messages
-            message_count = 0
-
-            for message in reversed(messages):
-
-                try:
-                    # Extract content from message
-                    content = ""
-                    msg_content = message.content
-
-                    if isinstance(msg_content, str):
-                        content = msg_content
-                    else:
-                        content = str(msg_content)
+        self._update_session_config_from(messages)
 
-                    if content:
-                        session_messages.append(
-                            {"role": message.role.value, "content": content}
-                        )
-                        message_count += 1
+    def _update_session_config_from(self, messages: List[Message]) -> None:
+        """
+        Write already fetched messages to the session_config file.
 
-                except Exception as e:
-                    logger.warning(f"Error processing message for session_config: {e}")
+        Args:
+            messages: Latest messages, oldest first
+        """
+        try:
+            # Prepare message list for session_config, oldest first, skipping empty content
+            contents = (
+                (
+                    message.role.value,
+                    message.content
+                    if isinstance(message.content, str)
+                    else str(message.content),
+                )
+                for message in messages
+            )
+            session_messages = [
+                {"role": role, "content": content} for role, content in contents if content
+            ]
+
+            # Ensure the last message is from assistant: cut after the last assistant message
+            for i in range(len(session_messages) - 1, -1, -1):
+                if session_messages[i]["role"] == "assistant":
+                    del session_messages[i + 1:]
+                    break
+            else:
+                session_messages.clear()
 
-            # Ensure the last message is from assistant
-            while session_messages and session_messages[-1]["role"] != "assistant":
-                session_messages.pop()
+            fingerprint = tuple((m["role"], m["content"]) for m in session_messages)
+            if fingerprint == self._session_messages_fingerprint:
+                return
 
             # Update session_config file
-            self._update_session_config_file(session_messages)
+            if self._update_session_config_file(session_messages):
+                self._session_messages_fingerprint = fingerprint
 
         except Exception as e:
             logger.error(f"Error updating session_config messages: {e}")
@@ -870,48 +1040,93 @@ class TicosClient(MessageCallbackInterface):
         """
         return HttpUtil.update_variables(self.config_service, priority)
 
-    def _update_session_config_file(self, messages):
+    def _update_session_config_file(self, messages) -> bool:
         """
         Update the session_config file with the provided messages.
-        Uses a safe write approach (write to temp file, then rename).
+        Uses a safe write approach (write to temp file, then rename). The file and
+        the rename are only flushed to disk when FSYNC_SESSION_CONFIG is set.
 
         Args:
             messages: List of message objects to write to the session_config
+
+        Returns:
+            bool: True if the file holds the messages afterwards, False otherwise
         """
         try:
-            # Path to session_config
-            session_config_path = Path.home() / ".config" / "ticos" / "session_config"
+            session_config_path = self._session_config_path
 
-            # Read current session_config
-            if not session_config_path.exists():
+            # Read current session_config, reusing the cached copy if the file is unchanged
+            try:
+                st = session_config_path.stat()
+            except FileNotFoundError:
                 logger.warning(f"Session config file not found: {session_config_path}")
-                return
+                return False
 
-            with open(session_config_path, "r") as f:
-                session_config = json.load(f)
+            file_stat = (st.st_mtime_ns, st.st_size)
+            session_config = self._session_config_cache
+            if session_config is None or file_stat != self._session_config_stat:
+                session_config = json_loads(session_config_path.read_bytes())
+                self._session_config_cache = session_config
+                self._session_config_stat = file_stat
 
             # Update messages under model.messages.nobody
             if "model" not in session_config:
                 session_config["model"] = {}
-                
+
+            current = session_config["model"].get("messages")
+            if isinstance(current, dict) and current.get("nobody") == messages:
+                logger.debug("Session config messages unchanged, skipping write")
+                return True
+
+            # Drop the cache until the write lands, it is about to be modified
+            self._session_config_cache = None
+
             # If messages is a list, convert to dict format with 'nobody' key
-            if "messages" not in session_config["model"] or isinstance(session_config["model"]["messages"], list):
+            if current is None or isinstance(current, list):
                 session_config["model"]["messages"] = {"nobody": messages}
             else:
                 # It's already a dict, update the 'nobody' key
-                session_config["model"]["messages"]["nobody"] = messages
+                current["nobody"] = messages
 
             # Write to temporary file
-            temp_path = session_config_path.with_suffix(".tmp")
-            with open(temp_path, "w") as f:
-                json.dump(session_config, f, indent=2, ensure_ascii=False)
+            temp_path = self._session_config_tmp
+            # Written straight to the descriptor, the encoded bytes need no file object
+            data = memoryview(json_dumps_indented(session_config))
+            flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+            fd = os.open(temp_path, flags, 0o644)
+            try:
+                while data:
+                    data = data[os.write(fd, data):]
+                if self.FSYNC_SESSION_CONFIG:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
 
             # Rename to overwrite original
             temp_path.replace(session_config_path)
+            if self.FSYNC_SESSION_CONFIG:
+                self._fsync_directory(session_config_path.parent)
+            st = session_config_path.stat()
+            self._session_config_cache = session_config
+            self._session_config_stat = (st.st_mtime_ns, st.st_size)
             logger.debug(f"Updated session_config with {len(messages)} messages")
+            return True
 
         except Exception as e:
             logger.error(f"Error writing session_config file: {e}")
+            return False
+
+    @staticmethod
+    def _fsync_directory(path: Path) -> None:
+        """Flush a directory entry to disk so a rename into it survives a crash"""
+        if not hasattr(os, "O_DIRECTORY"):
+            # Directories can't be opened for fsync on this platform
+            return
+        fd = os.open(str(path), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
 
 class DefaultMessageHandler:
     """
@@ -926,6 +1141,9 @@ class DefaultMessageHandler:
         Args:
             message: The message dictionary
         """
-        print(
-            f"[DefaultMessageHandler] Received message: {json.dumps(message, indent=2)}"
-        )
+        # Formatting every message is costly, only do it when it will be logged
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "[DefaultMessageHandler] Received message: %s",
+                json_dumps_indented(message).decode("utf-8"),
+            )
@@ -3,6 +3,8 @@ from typing import Dict, Any
 
 
 class MessageCallbackInterface(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def handle_message(self, message: Dict[str, Any]) -> bool:
         """Handle an incoming message. Should return True if handled successfully."""
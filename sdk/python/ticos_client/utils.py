@@ -1,12 +1,86 @@
+import json
 import os
 import re
 import subprocess
 import logging
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Any, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# Format of every datetime string stored with messages and memories
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# (epoch second, formatted string) of the last now_str() call
+_now_cache = (0, "")
+
+
+def now_str() -> str:
+    """
+    Get the current local time formatted with DATETIME_FORMAT.
+
+    The formatted string is cached for the current second, so frequent callers
+    skip strftime.
+
+    Returns:
+        The current time, e.g. "2024-01-01 12:00:00"
+    """
+    global _now_cache
+    second = int(time.time())
+    cached_second, formatted = _now_cache
+    if second != cached_second:
+        formatted = time.strftime(DATETIME_FORMAT, time.localtime(second))
+        _now_cache = (second, formatted)
+    return formatted
+
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    """
+    Parse a JSON document, with orjson when it is installed.
+
+    Invalid input raises json.JSONDecodeError either way, orjson's error subclasses it.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj: Any) -> str:
+    """
+    Serialize an object to a compact JSON string, with orjson when it is installed.
+
+    Non-ASCII characters are written as UTF-8 rather than escaped. Like json, non-str
+    dict keys are converted to strings; values orjson can't encode, such as integers
+    beyond 64 bits, fall back to json.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def json_dumps_indented(obj: Any) -> bytes:
+    """
+    Serialize an object to UTF-8 JSON indented by two spaces, with orjson when it is installed.
+
+    Used for config files that people read; non-ASCII characters are not escaped.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Values orjson can't encode, as in json_dumps()
+            pass
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
 
 def find_tf_root_directory() -> Optional[str]:
     """